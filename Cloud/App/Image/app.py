@@ -1,4 +1,8 @@
 import boto3
+import botocore.exceptions
+import collections
+import concurrent.futures
+import contextlib
 import os
 import subprocess
 import time
@@ -6,34 +10,45 @@ import json
 import psutil
 import zipfile
 import shlex
+import shutil
+import socket
+import re
+import signal
+import stat
 import requests
 import magic
 from urllib.parse import urlencode
 import yandexcloud
 import io
 import pathlib
+import hashlib
+import math
+import mmap
+import struct
 import tempfile
-import resource
+import threading
 import ydb
 import ydb.iam
-import matplotlib.pyplot as plt
 import numpy as np
 
 from yandex.cloud.lockbox.v1.payload_service_pb2 import GetPayloadRequest
 from yandex.cloud.lockbox.v1.payload_service_pb2_grpc import PayloadServiceStub
 
-
 # ---
 # YC Integration
 # ---
 
 boto_session = None
 storage_client = None
-docapi_table = None
+docapi_resource = None
+# Table name -> DocAPI table
+docapi_tables = {}
 ymq_queue = None
 tests_table = None
 driver = None
 ydb_session = None
+# Messages of a batch are judged in threads, clients are created once
+clients_lock = threading.RLock()
 
 
 def get_ydb_session():
@@ -41,15 +56,20 @@ def get_ydb_session():
     global ydb_session
     if driver is not None and ydb_session is not None:
         return ydb_session
-    driver = ydb.Driver(
-        endpoint=os.getenv("YDB_ENDPOINT"),
-        database=os.getenv("YDB_DATABASE"),
-        credentials=ydb.iam.MetadataUrlCredentials(),
-    )
 
-    driver.wait(fail_fast=True, timeout=5)
-    ydb_session = ydb.SessionPool(driver)
-    return ydb_session
+    with clients_lock:
+        if driver is not None and ydb_session is not None:
+            return ydb_session
+
+        driver = ydb.Driver(
+            endpoint=os.getenv("YDB_ENDPOINT"),
+            database=os.getenv("YDB_DATABASE"),
+            credentials=ydb.iam.MetadataUrlCredentials(),
+        )
+
+        driver.wait(fail_fast=True, timeout=5)
+        ydb_session = ydb.SessionPool(driver)
+        return ydb_session
 
 
 def get_boto_session():
@@ -57,29 +77,33 @@ def get_boto_session():
     if boto_session is not None:
         return boto_session
 
-    yc_sdk = yandexcloud.SDK()
-    channel = yc_sdk._channels.channel("lockbox-payload")
-    lockbox = PayloadServiceStub(channel)
-    response = lockbox.Get(GetPayloadRequest(secret_id=os.environ["SECRET_ID"]))
+    with clients_lock:
+        if boto_session is not None:
+            return boto_session
 
-    access_key = None
-    secret_key = None
-    for entry in response.entries:
-        if entry.key == "ACCESS_KEY_ID":
-            access_key = entry.text_value
-        elif entry.key == "SECRET_ACCESS_KEY":
-            secret_key = entry.text_value
+        yc_sdk = yandexcloud.SDK()
+        channel = yc_sdk._channels.channel("lockbox-payload")
+        lockbox = PayloadServiceStub(channel)
+        response = lockbox.Get(GetPayloadRequest(secret_id=os.environ["SECRET_ID"]))
 
-    if access_key is None or secret_key is None:
-        raise Exception("secrets required")
+        access_key = None
+        secret_key = None
+        for entry in response.entries:
+            if entry.key == "ACCESS_KEY_ID":
+                access_key = entry.text_value
+            elif entry.key == "SECRET_ACCESS_KEY":
+                secret_key = entry.text_value
 
-    print("DEBUG | Boto3 connection set with `key_id` = " + access_key)
+        if access_key is None or secret_key is None:
+            raise Exception("secrets required")
 
-    boto_session = boto3.session.Session(
-        aws_access_key_id=access_key, aws_secret_access_key=secret_key
-    )
+        print("DEBUG | Boto3 connection set with `key_id` = " + access_key)
 
-    return boto_session
+        boto_session = boto3.session.Session(
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key
+        )
+
+        return boto_session
 
 
 def get_ymq_queue():
@@ -87,35 +111,41 @@ def get_ymq_queue():
     if ymq_queue is not None:
         return ymq_queue
 
-    ymq_queue = (
-        get_boto_session()
-        .resource(
-            service_name="sqs",
-            endpoint_url="https://message-queue.api.cloud.yandex.net",
-            region_name="ru-central1",
+    with clients_lock:
+        if ymq_queue is not None:
+            return ymq_queue
+
+        ymq_queue = (
+            get_boto_session()
+            .resource(
+                service_name="sqs",
+                endpoint_url="https://message-queue.api.cloud.yandex.net",
+                region_name="ru-central1",
+            )
+            .Queue(os.environ["YMQ_QUEUE_URL"])
         )
-        .Queue(os.environ["YMQ_QUEUE_URL"])
-    )
 
-    return ymq_queue
+        return ymq_queue
 
 
 def get_docapi_table(table):
-    global docapi_table
-    if docapi_table is not None:
-        return docapi_table
-
-    docapi_table = (
-        get_boto_session()
-        .resource(
-            "dynamodb",
-            endpoint_url=os.environ["DOCAPI_ENDPOINT"],
-            region_name="ru-central1",
-        )
-        .Table(f"{table}")
-    )
+    global docapi_resource
+    if table in docapi_tables:
+        return docapi_tables[table]
+
+    with clients_lock:
+        if table in docapi_tables:
+            return docapi_tables[table]
+
+        if docapi_resource is None:
+            docapi_resource = get_boto_session().resource(
+                "dynamodb",
+                endpoint_url=os.environ["DOCAPI_ENDPOINT"],
+                region_name="ru-central1",
+            )
+        docapi_tables[table] = docapi_resource.Table(f"{table}")
 
-    return docapi_table
+        return docapi_tables[table]
 
 
 def get_tests_table():
@@ -123,17 +153,21 @@ def get_tests_table():
     if tests_table is not None:
         return tests_table
 
-    tests_table = (
-        get_boto_session()
-        .resource(
-            "dynamodb",
-            endpoint_url=os.environ["ENDPOINT_TESTS"],
-            region_name="ru-central1",
+    with clients_lock:
+        if tests_table is not None:
+            return tests_table
+
+        tests_table = (
+            get_boto_session()
+            .resource(
+                "dynamodb",
+                endpoint_url=os.environ["ENDPOINT_TESTS"],
+                region_name="ru-central1",
+            )
+            .Table("tests")
         )
-        .Table("tests")
-    )
 
-    return tests_table
+        return tests_table
 
 
 def get_storage_client():
@@ -141,13 +175,17 @@ def get_storage_client():
     if storage_client is not None:
         return storage_client
 
-    storage_client = get_boto_session().client(
-        service_name="s3",
-        endpoint_url="https://storage.yandexcloud.net",
-        region_name="ru-central1",
-    )
+    with clients_lock:
+        if storage_client is not None:
+            return storage_client
 
-    return storage_client
+        storage_client = get_boto_session().client(
+            service_name="s3",
+            endpoint_url="https://storage.yandexcloud.net",
+            region_name="ru-central1",
+        )
+
+        return storage_client
 
 
 def upload_file_to_s3(file_obj, bucket, object_name):
@@ -155,6 +193,265 @@ def upload_file_to_s3(file_obj, bucket, object_name):
     get_storage_client().upload_file(file_obj, bucket, object_name)
 
 
+# ---
+# Test data cache
+# ---
+
+# Content-addressed: blobs are named by sha256 of their content and `refs`
+# map `bucket/object@stamp` onto them, where stamp is `version` from `tests`
+# table (hit skips the network) or object ETag (one HEAD request instead of GET).
+TEST_CACHE_DIR = os.getenv("TEST_CACHE_DIR", "/tmp/cache/tests")
+
+test_cache_lock = threading.Lock()
+test_cache_blobs = None
+test_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_test_cache_blobs():
+    # Digest -> size, least recently used first (restored from mtime on start)
+    global test_cache_blobs
+    if test_cache_blobs is not None:
+        return test_cache_blobs
+
+    blobs_dir = pathlib.Path(TEST_CACHE_DIR, "blobs")
+    blobs_dir.mkdir(parents=True, exist_ok=True)
+    pathlib.Path(TEST_CACHE_DIR, "refs").mkdir(parents=True, exist_ok=True)
+
+    blobs = sorted(blobs_dir.iterdir(), key=lambda blob: blob.stat().st_mtime)
+    test_cache_blobs = collections.OrderedDict(
+        (blob.name, blob.stat().st_size) for blob in blobs
+    )
+    return test_cache_blobs
+
+
+def evict_test_cache(blobs):
+    max_bytes = int(os.getenv("TEST_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    total_bytes = sum(blobs.values())
+    now = time.time()
+    for digest in list(blobs):
+        if total_bytes <= max_bytes:
+            break
+        blob_path = pathlib.Path(TEST_CACHE_DIR, "blobs", digest)
+        # NOTE: Blobs used within the last minute may be opened by a running test
+        if now - blob_path.stat().st_mtime < 60:
+            continue
+        blob_path.unlink()
+        total_bytes -= blobs.pop(digest)
+        print(f"DEBUG | Test cache evicted blob {digest}")
+
+
+def fetch_cached(bucket, object_name, stamp=None):
+    client = get_storage_client()
+    if stamp is None:
+        stamp = client.head_object(Bucket=bucket, Key=object_name)["ETag"]
+
+    ref = hashlib.sha256(f"{bucket}/{object_name}@{stamp}".encode()).hexdigest()
+    ref_path = pathlib.Path(TEST_CACHE_DIR, "refs", ref)
+    with test_cache_lock:
+        blobs = get_test_cache_blobs()
+        digest = ref_path.read_text() if ref_path.exists() else None
+        if digest in blobs:
+            test_cache_stats["hits"] += 1
+            blobs.move_to_end(digest)
+            blob_path = pathlib.Path(TEST_CACHE_DIR, "blobs", digest)
+            os.utime(blob_path)
+            return str(blob_path)
+        test_cache_stats["misses"] += 1
+
+    with tempfile.NamedTemporaryFile(dir=TEST_CACHE_DIR, delete=False) as tmp:
+        client.download_fileobj(bucket, object_name, tmp)
+    try:
+        content_hash = hashlib.sha256()
+        with open(tmp.name, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        digest = content_hash.hexdigest()
+        blob_path = pathlib.Path(TEST_CACHE_DIR, "blobs", digest)
+        size = os.path.getsize(tmp.name)
+        os.replace(tmp.name, blob_path)
+    except Exception:
+        os.unlink(tmp.name)
+        raise
+
+    with test_cache_lock:
+        ref_path.write_text(digest)
+        blobs[digest] = size
+        blobs.move_to_end(digest)
+        evict_test_cache(blobs)
+
+    return str(blob_path)
+
+
+def get_test_cache_stats():
+    with test_cache_lock:
+        return dict(test_cache_stats)
+
+
+# ---
+# Test bundles
+# ---
+
+# One object per task, `{contest}_{task_n}.bundle` (see Setup/Configure/tests-bundle.py):
+#   header: b"CTB1", tests count (uint32)
+#   index:  (in_offset, in_length, out_offset, out_length) as uint64 per test
+#   data:   inputs and expected outputs, addressed by the index
+BUNDLE_MAGIC = b"CTB1"
+BUNDLE_HEADER = struct.Struct("<4sI")
+BUNDLE_ENTRY = struct.Struct("<QQQQ")
+
+test_bundles_lock = threading.Lock()
+test_bundles = collections.OrderedDict()
+missing_bundles = {}
+
+
+def read_test_bundle(bundle_path):
+    with open(bundle_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic_bytes, count = BUNDLE_HEADER.unpack_from(mapped, 0)
+    if magic_bytes != BUNDLE_MAGIC:
+        raise Exception(f"Not a test bundle: {bundle_path}")
+
+    index = [
+        BUNDLE_ENTRY.unpack_from(mapped, BUNDLE_HEADER.size + i * BUNDLE_ENTRY.size)
+        for i in range(count)
+    ]
+    return {"mmap": mapped, "data": memoryview(mapped), "index": index}
+
+
+def open_test_bundle(key_test, version=None):
+    # Bundle (or its absence) is remembered per version, without a version
+    # absence is rechecked after a minute
+    stamp = None if version is None else f"v{version}"
+    with test_bundles_lock:
+        missing_since = missing_bundles.get((key_test, stamp))
+        if missing_since is not None and (
+            stamp is not None or time.time() - missing_since < 60
+        ):
+            return None
+
+    try:
+        bundle_path = fetch_cached("hw6-for-upload", f"{key_test}.bundle", stamp)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] not in ["404", "NoSuchKey"]:
+            raise
+        print(f"DEBUG | No test bundle for {key_test}, using per-file tests")
+        with test_bundles_lock:
+            missing_bundles[(key_test, stamp)] = time.time()
+        return None
+
+    with test_bundles_lock:
+        bundle = test_bundles.get(bundle_path)
+        if bundle is None:
+            bundle = read_test_bundle(bundle_path)
+            test_bundles[bundle_path] = bundle
+            # NOTE: Mapping itself is closed by GC once running tests release it
+            while len(test_bundles) > 16:
+                test_bundles.popitem(last=False)
+        test_bundles.move_to_end(bundle_path)
+        return bundle
+
+
+def get_bundle_test(bundle, n):
+    in_offset, in_length, out_offset, out_length = bundle["index"][int(n) - 1]
+    data = bundle["data"]
+    return (
+        data[in_offset : in_offset + in_length],
+        data[out_offset : out_offset + out_length],
+    )
+
+
+# ---
+# Checker
+# ---
+
+# Outputs are compared in fixed-size chunks, so memory doesn't depend on their
+# size and the first difference stops reading. Modes (`checker` in `tests`):
+#   tokens -- whitespace-insensitive, token by token (default)
+#   exact  -- byte by byte
+CHECKER_CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(rb"\s+")
+
+
+def read_chunks(source, chunk_size=CHECKER_CHUNK_SIZE):
+    # `source` is a path or a mapped region of a test bundle
+    if isinstance(source, memoryview):
+        for offset in range(0, len(source), chunk_size):
+            yield source[offset : offset + chunk_size].tobytes()
+        return
+
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield chunk
+
+
+def normalize_chunks(chunks):
+    # Whitespace runs become single spaces, leading and trailing ones are
+    # dropped: tokens "1 2 3" compare equal regardless of original spacing
+    started = False
+    pending_space = False
+    for chunk in chunks:
+        chunk = WHITESPACE.sub(b" ", chunk)
+        if chunk.startswith(b" "):
+            chunk = chunk[1:]
+            pending_space = started
+        trailing_space = chunk.endswith(b" ")
+        if trailing_space:
+            chunk = chunk[:-1]
+        if not chunk:
+            pending_space = pending_space or (started and trailing_space)
+            continue
+        yield b" " + chunk if pending_space else chunk
+        started = True
+        pending_space = trailing_space
+
+
+def compare_outputs(program_output, correct_output, mode="tokens"):
+    # Returns None if outputs match, else position of the first difference
+    program_chunks = read_chunks(program_output)
+    correct_chunks = read_chunks(correct_output)
+    if mode == "tokens":
+        program_chunks = normalize_chunks(program_chunks)
+        correct_chunks = normalize_chunks(correct_chunks)
+
+    program_buffer = b""
+    correct_buffer = b""
+    position = 0
+    separators = 0
+    while True:
+        if not program_buffer:
+            program_buffer = next(program_chunks, None)
+        if not correct_buffer:
+            correct_buffer = next(correct_chunks, None)
+        if program_buffer is None and correct_buffer is None:
+            return None
+
+        if program_buffer is None or correct_buffer is None:
+            # One of outputs is shorter
+            mismatch = 0
+            rest = program_buffer if correct_buffer is None else correct_buffer
+            next_token = rest.startswith(b" ")
+        else:
+            size = min(len(program_buffer), len(correct_buffer))
+            if program_buffer[:size] == correct_buffer[:size]:
+                separators += program_buffer.count(b" ", 0, size)
+                position += size
+                program_buffer = program_buffer[size:]
+                correct_buffer = correct_buffer[size:]
+                continue
+            mismatch = next(
+                i for i in range(size) if program_buffer[i] != correct_buffer[i]
+            )
+            next_token = False
+            separators += program_buffer.count(b" ", 0, mismatch)
+
+        if mode == "tokens":
+            token = separators + 1 + int(next_token)
+            return {"token": token, "description": f"Mismatch at token #{token}"}
+        position += mismatch
+        return {"byte": position, "description": f"Mismatch at byte #{position}"}
+
+
 # ---
 # Processing helpers
 # ---
@@ -209,7 +506,7 @@ def validate_input(file_path, language, mode="unit"):
     """
 
     print("DEBUG | Validating files in `DIRECTORY` = ", directory)
-    path_test = directory + "/solution.py"
+    path_test = directory + ("/solution.cpp" if language == "cpp" else "/solution.py")
     print("DEBUG | Validating file with path `PATH_TEST` = ", path_test)
     print("DEBUG | Does the given file exist? :", os.path.exists(path_test))
 
@@ -217,25 +514,19 @@ def validate_input(file_path, language, mode="unit"):
     return True
 
 
-def download_from_bucket(object_name, n):
+def download_from_bucket(object_name, n, version=None, bundle=None):
+    # Returns paths of per-file tests or mapped regions of `bundle`, which the
+    # caller opens once per task (see `run_solution`)
     try:
-        pathlib.Path(f"/tmp/testing/{n}_in.txt").parent.mkdir(
-            parents=True, exist_ok=True
-        )
-        pathlib.Path(f"/tmp/testing/{n}_out.txt").parent.mkdir(
-            parents=True, exist_ok=True
-        )
+        if bundle is not None:
+            return get_bundle_test(bundle, n)
 
-        print("DEBUG | Created a libraries for temp files in a download from bucket!")
-        client = get_storage_client()
+        stamp = None if version is None else f"v{version}"
         bucket = "hw6-for-upload"
-        client.download_file(
-            bucket, object_name + f"_{n}_in.txt", f"/tmp/testing/{n}_in.txt"
-        )
-        client.download_file(
-            bucket, object_name + f"_{n}_out.txt", f"/tmp/testing/{n}_out.txt"
-        )
+        input_file_path = fetch_cached(bucket, object_name + f"_{n}_in.txt", stamp)
+        output_file_path = fetch_cached(bucket, object_name + f"_{n}_out.txt", stamp)
         print("DEBUG | Download of object_name = ", object_name, " went successfully!")
+        return input_file_path, output_file_path
     except Exception as e:
         print(f"DEBUG | Caught exception in download from bucket! Error: {str(e)}")
         return False
@@ -245,7 +536,9 @@ def download_from_ya_disk(public_key, dst, language, mode="unit"):
     try:
         directory = os.path.dirname(dst)
         if not os.path.exists(directory):
-            os.makedirs(directory)  # for missing dir fix
+            # Root-only: solutions and `g++` run as the sandbox user, they get
+            # the source through stdin (`compile_cpp`) or a copy (`run_python`)
+            os.makedirs(directory, mode=0o700)  # for missing dir fix
 
         api_call_url = (
             "https://cloud-api.yandex.net/v1/disk/public/resources/download?"
@@ -279,582 +572,1063 @@ def download_from_ya_disk(public_key, dst, language, mode="unit"):
 # ---
 
 
-def run_cpp(tests, task_id):
-    subprocess.run(["g++", "-o", "main", f"/tmp/{task_id}/main.cpp"])
-
-    results = []
-    for test in tests:
-        # input_file = "input.txt"
-        # output_file = "output.txt"
-        # NOTE: filesystem is read-only!
-        # Consider it if adding new code for your own tests
-        # with open(input_file, "w") as f:
-        #     f.write(test["input"])
-        start_time = time.time()
-        # TODO -- fix mess
-        subprocess.run(["./main", "<", input_file, ">", output_file])
-        end_time = time.time()
-        with open(output_file, "r") as f:
-            output = f.read()
-        results.append(
-            {
-                "input": test["input"],
-                "output": output,
-                "expected_output": test["output"],
-                "time": end_time - start_time,
-                "memory_usage": get_memory_usage(),
-            }
-        )
-
-    total_time = sum(result["time"] for result in results)
-    total_memory_usage = sum(result["memory_usage"] for result in results)
-    average_time = total_time / len(results)
-    average_memory_usage = total_memory_usage / len(results)
-
-    table = dynamodb.Table("results")
-    table.put_item(
-        Item={
-            "id": event["code_id"],
-            "results": results,
-            "average_time": average_time,
-            "average_memory_usage": average_memory_usage,
-        }
+# Flags must match the precompiled header built in Dockerfile
+CPP_FLAGS = shlex.split(os.getenv("CPP_FLAGS", "-O2 -std=c++17"))
+CPP_PCH_DIR = os.getenv("CPP_PCH_DIR", "/opt/pch")
+CPP_CACHE_DIR = os.getenv("CPP_CACHE_DIR", "/tmp/cache/bin")
+# Cached binary is named by its build hash (sha256 hex digest)
+CPP_BINARY_NAME = re.compile(r"[0-9a-f]{64}")
+CPP_COMPILE_TIMEOUT = int(os.getenv("CPP_COMPILE_TIMEOUT", "30"))
+CPP_COMPILE_MEMORY_LIMIT = int(os.getenv("CPP_COMPILE_MEMORY_MB", "1024"))
+
+compiler_version = None
+
+
+def get_compiler_version():
+    global compiler_version
+    if compiler_version is not None:
+        return compiler_version
+
+    compiler_version = subprocess.run(
+        ["g++", "-dumpfullversion"], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    return compiler_version
+
+
+def compile_cpp(source_path):
+    # Binaries are cached by source hash + compiler flags, so resubmissions
+    # and rejudges don't call `g++` at all. Returns (binary, compiler errors).
+    flags = list(CPP_FLAGS)
+    if os.path.exists(os.path.join(CPP_PCH_DIR, "bits", "stdc++.h.gch")):
+        flags += ["-I", CPP_PCH_DIR]
+
+    with open(source_path, "rb") as f:
+        source = f.read()
+    build_hash = hashlib.sha256(source)
+    build_hash.update("\0".join([get_compiler_version()] + flags).encode())
+    binary_path = os.path.join(CPP_CACHE_DIR, build_hash.hexdigest())
+
+    if os.path.exists(binary_path):
+        print(f"DEBUG | Compiled binary found in cache: {binary_path}")
+        os.utime(binary_path)
+        return binary_path, None
+
+    pathlib.Path(CPP_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    # `g++` runs in the sandbox of solutions: as `SANDBOX_UID` with rlimits, so
+    # `#include` of a file that user can't read fails instead of echoing it in
+    # the errors. Source goes through stdin (task directories are root-only),
+    # the binary is written into a scratch directory of the sandbox user.
+    sandbox = get_sandbox_limits(
+        {"tl": CPP_COMPILE_TIMEOUT, "ml": CPP_COMPILE_MEMORY_LIMIT}
     )
+    build_dir = tempfile.mkdtemp(dir=CPP_CACHE_DIR)
+    try:
+        if sandbox["uid"] is not None:
+            os.chown(build_dir, sandbox["uid"], sandbox["uid"])
+        output_path = os.path.join(build_dir, "solution")
+        header = f'#line 1 "{os.path.basename(source_path)}"\n'.encode()
+        start_time = time.perf_counter()
+        with open(os.devnull, "wb") as devnull:
+            compilation = run_measured(
+                ["g++"] + flags + ["-x", "c++", "-o", output_path, "-"],
+                memoryview(header + source),
+                devnull,
+                CPP_COMPILE_TIMEOUT,
+                sandbox,
+            )
+        print(f"DEBUG | Compiled in {time.perf_counter() - start_time:.2f}s")
+        if compilation["sandbox_error"]:
+            raise Exception(f"Unable to start the compiler\n{compilation['error']}")
+        if compilation["timed_out"]:
+            return None, "Compilation time limit exceeded"
+        if compilation["returncode"] != 0:
+            return None, compilation["error"]
+
+        # Copied by root: the cached binary can't be changed by the sandbox user
+        tmp_path = f"{binary_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, binary_path)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    evict_compile_cache()
+    return binary_path, None
+
+
+def evict_compile_cache():
+    # Only finished binaries: build directories and `.tmp` copies of concurrent
+    # compilations are theirs. Any file may vanish meanwhile (evicted by another
+    # thread)
+    max_binaries = int(os.getenv("CPP_CACHE_MAX_BINARIES", "256"))
+    binaries = []
+    for binary in pathlib.Path(CPP_CACHE_DIR).iterdir():
+        if not CPP_BINARY_NAME.fullmatch(binary.name):
+            continue
+        try:
+            info = binary.stat()
+        except FileNotFoundError:
+            continue
+        if stat.S_ISREG(info.st_mode):
+            binaries.append((info.st_mtime, binary))
 
-    return {"statusCode": 200, "statusMessage": "OK"}
+    binaries.sort()
+    for _, binary in binaries[: max(len(binaries) - max_binaries, 0)]:
+        binary.unlink(missing_ok=True)
 
 
-def set_memory_limit(limit):
-    # Convert limit from bytes MB + set mem_limit (also in MB)
-    limit_bytes = limit * 1024 * 1024
+def run_cpp(tests_response, task_id, key_test, user=None):
+    try:
+        binary_path, errors = compile_cpp(f"/tmp/{task_id}/solution.cpp")
+    except Exception as e:
+        return report_verdict(task_id, "UB", None, str(e))
+    if binary_path is None:
+        # Compilation error
+        return report_verdict(task_id, "CE", None, errors)
+
+    return run_solution([binary_path], tests_response, task_id, key_test, user=user)
+
+
+# Per-run copies of Python solutions for the sandbox user. The directory is
+# traversable but not listable, so a solution can't find copies of others
+SANDBOX_COPIES_DIR = os.getenv("SANDBOX_COPIES_DIR", "/tmp/sandbox")
+
+
+def copy_for_sandbox(task_id, uid):
+    # Task directory stays root-only, the interpreter reads the solution (and
+    # its modules) from a copy owned by the sandbox user
+    pathlib.Path(SANDBOX_COPIES_DIR).mkdir(parents=True, exist_ok=True)
+    os.chmod(SANDBOX_COPIES_DIR, 0o711)
+    directory = tempfile.mkdtemp(dir=SANDBOX_COPIES_DIR)
+    shutil.copytree(
+        f"/tmp/{task_id}",
+        directory,
+        ignore=shutil.ignore_patterns("solution.zip"),
+        dirs_exist_ok=True,
+    )
+    if uid is not None:
+        for root, dirs, files in os.walk(directory):
+            for path in [root] + [os.path.join(root, name) for name in dirs + files]:
+                os.chown(path, uid, uid)
+    return directory
+
+
+def run_python(tests_response, task_id, key_test, user=None):
+    directory = copy_for_sandbox(task_id, get_sandbox_limits(tests_response)["uid"])
+    command = ["python3", f"{directory}/solution.py"]
+    contest = key_test.split("_")[0]
+    # Fork server is opt-in as well: per task `zygote` or `ZYGOTE_CONTESTS`
+    runner = run_measured
+    if get_task_option(tests_response, contest, "zygote"):
+        runner = run_in_zygote
+    try:
+        return run_solution(command, tests_response, task_id, key_test, runner, user)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
 
-    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
 
+# ---
+# Task statistics (aggregate over accepted solutions, see Cloud/Db/TaskStats.sql)
+# ---
 
-def plot_graphs(solutions, task_id, user_avg_time_usage, user_avg_memory_usage):
+# Distribution of a task is a quantile sketch with relative error of
+# `SKETCH_ACCURACY` (DDSketch-like): value x goes into bucket ceil(log_gamma(x)),
+# sketches merge by adding counts. Log-spaced buckets follow the values
+# wherever they are, the bot renders its graphs from them.
+# A sketch carries its `gamma` and `min_value`: readers (API `sketch_rank`, the
+# bot's `graphs.py`, Setup/Configure) take them from there, not from here
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+SKETCH_MIN_VALUE = 1e-6
+
+
+def new_sketch():
+    return {
+        "gamma": SKETCH_GAMMA,
+        "min_value": SKETCH_MIN_VALUE,
+        "zero": 0,
+        "buckets": {},
+    }
+
+
+def sketch_add(sketch, value, count=1):
+    if value <= sketch["min_value"]:
+        sketch["zero"] += count
+        return
+    key = str(math.ceil(math.log(value, sketch["gamma"])))
+    sketch["buckets"][key] = sketch["buckets"].get(key, 0) + count
+
+
+def sketch_quantile(sketch, q):
+    total = sketch["zero"] + sum(sketch["buckets"].values())
+    if total == 0:
+        return None
+    rank = q * (total - 1)
+    seen = sketch["zero"]
+    if rank < seen:
+        return 0.0
+    for key in sorted(sketch["buckets"], key=int):
+        seen += sketch["buckets"][key]
+        if rank < seen:
+            # Middle of the bucket (gamma^(k-1), gamma^k] in relative terms
+            return 2 * sketch["gamma"] ** int(key) / (sketch["gamma"] + 1)
+    return None
+
+
+def new_task_stats():
+    return {
+        "total": 0,
+        "version": 0,
+        "time_sketch": new_sketch(),
+        "memory_sketch": new_sketch(),
+    }
+
+
+def read_task_stats(row):
+    return {
+        "total": row.total,
+        "version": row.version,
+        "time_sketch": json.loads(row.time_sketch),
+        "memory_sketch": json.loads(row.memory_sketch),
+    }
+
+
+def add_to_task_stats(stats, time_usage, memory_usage):
+    stats["total"] += 1
+    stats["version"] += 1
+    sketch_add(stats["time_sketch"], time_usage)
+    sketch_add(stats["memory_sketch"], memory_usage)
+    return stats
 
-    # Uncomment for DB debug!
-    """
-    try:
-        print(solutions)
-    except Exception as e:
-        print(
-            f"DEBUG | Solutions were not found or can't be printed. Error here: {str(e)}"
-        )
-    """
 
-    sorted_solutions_time = sorted(solutions, key=lambda x: x["avg_time_usage"])
-    sorted_solutions_memory = sorted(solutions, key=lambda x: x["avg_memory_usage"])
-
-    avg_time_usages = [sol["avg_time_usage"] for sol in sorted_solutions_time]
-    avg_memory_usages = [sol["avg_memory_usage"] for sol in sorted_solutions_memory]
-
-    # Time usage graph (1)
-    plt.figure(figsize=(10, 5))
-    plt.plot(avg_time_usages, marker="o")
-    plt.scatter(
-        avg_time_usages.index(user_avg_time_usage),
-        user_avg_time_usage,
-        color="red",
-        zorder=5,
-        label="Your solution!",
-    )
-    plt.xlabel("Percentage of solutions")
-    plt.ylabel("Runtime (in ms)")
-    plt.title("Average runtime usage distribution")
-    plt.legend()
-    # time_usage_file = io.BytesIO()
-    # plt.savefig(time_usage_file, format='png')
-    # time_usage_file.seek(0)
-    pathlib.Path("/tmp/data/avg_time_usage.png").parent.mkdir(
-        parents=True, exist_ok=True
-    )
-    plt.savefig("/tmp/data/avg_time_usage.png")
-    upload_file_to_s3(
-        "/tmp/data/avg_time_usage.png", "hw-6", f"graphs/time/{task_id}.png"
-    )
+# ---
+# Persistence (YDB)
+# ---
 
-    # Memory_usage graph (2)
-    plt.figure(figsize=(10, 5))
-    plt.plot(avg_memory_usages, marker="o")
-    plt.scatter(
-        avg_memory_usages.index(user_avg_memory_usage),
-        user_avg_memory_usage,
-        color="red",
-        zorder=5,
-        label="Your solution",
-    )
-    plt.xlabel("Percentage of solutions")
-    plt.ylabel("Memory (in MB)")
-    plt.title(f"Average memory usage distribution for task #.")
-    plt.legend()
-    pathlib.Path("/tmp/data/avg_memory_usage.png").parent.mkdir(
-        parents=True, exist_ok=True
-    )
-    plt.savefig("/tmp/data/avg_memory_usage.png")
-    upload_file_to_s3(
-        "/tmp/data/avg_memory_usage.png", "hw-6", f"graphs/memory/{task_id}.png"
-    )
-    print("DEBUG | Uploads of graphs went successfully!")
+# Per-test metrics of a solution are one `test_metrics` column of Results:
+# fixed-width little-endian float32 records, one per test in test order, in
+# NumPy's .npy format. 12 bytes per test instead of a column (or a JSON list)
+# per value, and the header describes the records, so readers (see
+# Setup/Configure/base.py) decode it without a copy of `TEST_METRICS_DTYPE`
+TEST_METRICS_DTYPE = np.dtype(
+    [("wall_time", "<f4"), ("cpu_time", "<f4"), ("memory", "<f4")]
+)
 
 
-def plot_graphs_alternative(
-    solutions, task_id, user_avg_time_usage, user_avg_memory_usage, contest, task_n
-):
-    print("DEBUG | Plotting - 1 passed!")
-
-    avg_time_usages = [sol["avg_time_usage"] for sol in solutions]
-    avg_memory_usages = [sol["avg_memory_usage"] for sol in solutions]
-    print("DEBUG | Plotting - 2 passed!")
-
-    time_bins = np.linspace(min(avg_time_usages), max(avg_time_usages), 10)
-    memory_bins = np.linspace(min(avg_memory_usages), max(avg_memory_usages), 10)
-    print("DEBUG | Plotting - 3 passed!")
-
-    time_histogram, _ = np.histogram(avg_time_usages, bins=time_bins)
-    memory_histogram, _ = np.histogram(avg_memory_usages, bins=memory_bins)
-
-    total_solutions = len(solutions)
-    time_percentage = (time_histogram / total_solutions) * 100
-    memory_percentage = (memory_histogram / total_solutions) * 100
-    print("DEBUG | Plotting - 4 passed!")
-    # Time usage graph (1)
-    plt.figure(figsize=(10, 5))
-    plt.bar(
-        time_bins[:-1],
-        time_percentage,
-        width=np.diff(time_bins),
-        align="edge",
-        edgecolor="black",
-    )
-    plt.scatter(user_avg_time_usage, 0, color="red", label="Your solution", zorder=5)
-    plt.xlabel("Average runtime usage (in MS)")
-    plt.ylabel("Percentage of Solutions")
-    plt.title(f"Runtime distribution for task {contest}#{task_n}.")
-    plt.legend()
-    print("DEBUG | Plotting - 5 passed!")
-    pathlib.Path(f"/tmp/data/time_distribution_{task_id}.png").parent.mkdir(
-        parents=True, exist_ok=True
-    )
-    plt.savefig(f"/tmp/data/time_distribution_{task_id}.png")
-    print("DEBUG | Plotting - 6 passed!")
-    upload_file_to_s3(
-        f"/tmp/data/time_distribution_{task_id}.png",
-        "hw-6",
-        f"graphs/time_distribution/{task_id}.png",
-    )
-    print("DEBUG | Plotting - 7 passed!")
-
-    # Memory usage graph (2)
-    plt.figure(figsize=(10, 5))
-    plt.bar(
-        memory_bins[:-1],
-        memory_percentage,
-        width=np.diff(memory_bins),
-        align="edge",
-        edgecolor="black",
-    )
-    plt.scatter(user_avg_memory_usage, 0, color="red", label="Your solution", zorder=5)
-    plt.xlabel("Average memory usage (in MB)")
-    plt.ylabel("Percentage of solutions")
-    plt.title(f"Memory usage distribution for task {contest}#{task_n}.")
-    plt.legend()
-    pathlib.Path(f"/tmp/data/memory_distribution_{task_id}.png").parent.mkdir(
-        parents=True, exist_ok=True
-    )
-    plt.savefig(f"/tmp/data/memory_distribution_{task_id}.png")
-    upload_file_to_s3(
-        f"/tmp/data/memory_distribution_{task_id}.png",
-        "hw-6",
-        f"graphs/memory_distribution/{task_id}.png",
-    )
+def pack_test_metrics(results):
+    # `results` of passed tests, sorted by test number
+    metrics = np.empty(len(results), dtype=TEST_METRICS_DTYPE)
+    metrics["wall_time"] = [result["wall_time"] for result in results]
+    metrics["cpu_time"] = [result["time"] for result in results]
+    metrics["memory"] = [result["memory"] for result in results]
+    data = io.BytesIO()
+    np.save(data, metrics, allow_pickle=False)
+    return data.getvalue()
 
-    print("DEBUG | Uploads of graphs went successfully!")
 
+# Statements are module constants: `session.prepare` caches prepared queries
+# per session by their text, so each one is compiled once per pooled session
+YDB_SETTINGS = ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
 
-def run_python(tests_response, task_id, key_test):
-    time_limits = []
-    memory_limits = []
-    print(tests_response)
-    tests_total = int(tests_response["total"])
-    time_limit = int(tests_response["tl"])
-    memory_limit = int(tests_response["ml"])
-    for i in range(1, tests_total + 1):
-        print(f"DEBUG | TEST_{i} started!")  # , tests_response[f"{str(i)}_in"])
-        # test = tests_response[f"{str(i)}_in"]
-        download_from_bucket(key_test, str(i))
-        input_file_path = f"/tmp/testing/{str(i)}_in.txt"
-        output_file_path = f"/tmp/testing/{str(i)}_out.txt"
-        # NOTE: We work in read-only fs, so we use
-        # temporary files
+SAVE_RESULT_READ_YQL = """
+DECLARE $task_id AS Utf8;
+DECLARE $contest AS Utf8;
+DECLARE $task_n AS Int32;
+DECLARE $user AS Utf8?;
 
-        try:
-            # Run the program with a timeout and memory limit
-            # NOTE: Comment for unlimited usage
-            # set_memory_limit(memory_limit)
-            memory_usage_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
-
-            with tempfile.NamedTemporaryFile(delete=False) as output_temp:
-                process = subprocess.Popen(
-                    ["python3", f"/tmp/{task_id}/solution.py"],
-                    stdin=open(input_file_path, "r"),
-                    stdout=output_temp,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                )
-                output, error = process.communicate(timeout=time_limit)
-
-                start_time = time.time()
-                while True:
-                    if process.poll() is not None:
-                        break
-                    if time.time() - start_time > time_limit:
-                        process.kill()
-                        raise subprocess.TimeoutExpired(
-                            "Program took too long to run (time limit exceeded)",
-                        )
-                    time.sleep(0.1)
-
-                end_time = time.time()
-                elapsed_time = float(end_time - start_time)
-                memory_usage_tmp = resource.getrusage(
-                    resource.RUSAGE_CHILDREN
-                ).ru_maxrss
-                memory_usage = float(
-                    max(memory_usage_tmp - memory_usage_before, 0) / 1024
-                )
-                time_limits.append(elapsed_time)
-                memory_limits.append(memory_usage)
-
-            with open(output_temp.name, "r") as f:
-                program_output = f.read()
-
-            with open(output_file_path, "r") as f:
-                correct_output = f.read()
-
-            if program_output.strip() != correct_output.strip():
-                get_docapi_table("tasks").update_item(
-                    Key={"task_id": task_id},
-                    AttributeUpdates={
-                        "status": {"Value": "DONE", "Action": "PUT"},
-                        "result": {"Value": "WA", "Action": "PUT"},
-                        "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                    },
-                )
-                return
-
-        except subprocess.CalledProcessError as e:
-            # Runtime error (non-zero exit code)
-            get_docapi_table("tasks").update_item(
-                Key={"task_id": task_id},
-                AttributeUpdates={
-                    "status": {"Value": "DONE", "Action": "PUT"},
-                    "result": {"Value": "RE", "Action": "PUT"},
-                    "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                    "output": {"Value": f"{str(e)}", "Action": "PUT"},
-                },
-            )
-            """
-            results.append(
-                {
-                "input": test["input"],
-                "output": "",
-                "expected_output": test["output"],
-                "time": 0,
-                "memory_usage": current_memory,
-                "error": str(e),
-                }
-            )
-            """
-            return
-        except MemoryError as e:
-            # Memory limit
-            get_docapi_table("tasks").update_item(
-                Key={"task_id": task_id},
-                AttributeUpdates={
-                    "status": {"Value": "DONE", "Action": "PUT"},
-                    "result": {"Value": "ML", "Action": "PUT"},
-                    "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                    "output": {"Value": f"{str(e)}", "Action": "PUT"},
-                },
-            )
-            return
-        except subprocess.TimeoutExpired as e:
-            # Time limit
-            get_docapi_table("tasks").update_item(
-                Key={"task_id": task_id},
-                AttributeUpdates={
-                    "status": {"Value": "DONE", "Action": "PUT"},
-                    "result": {"Value": "TL", "Action": "PUT"},
-                    "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                    "output": {"Value": f"{str(e)}", "Action": "PUT"},
-                },
-            )
-            """
-            results.append(
-                {
-                "input": test["input"],
-                "output": "",
-                "expected_output": test["output"],
-                "time": 0,
-                "memory_usage": current_memory,
-                "error": f"Program took too long to run (time limit: {time_limit:.2f}s)",
-                }
-            )
-            """
-            return
-        except Exception as e:
-            # Other errors
-            """
-            results.append(
-                {
-                "input": test["input"],
-                "output": "",
-                "expected_output": test["output"],
-                "time": 0,
-                "memory_usage": current_memory,
-                "error": str(e),
-                }
-            )
-            """
-            get_docapi_table("tasks").update_item(
-                Key={"task_id": task_id},
-                AttributeUpdates={
-                    "status": {"Value": "DONE", "Action": "PUT"},
-                    "result": {"Value": "UB", "Action": "PUT"},
-                    "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                    "output": {"Value": f"{str(e)}", "Action": "PUT"},
-                },
-            )
-            return
-        else:
-            print("DEBUG | Passed all tests, proceeding to ydb & graphs...")
-            # Successful
-            # output = output_data
-            """
-            results.append(
-                {
-                "input": test["input"],
-                "output": output,
-                "expected_output": test["output"],
-                "time": time.time() - current_time,
-                "memory_usage": memory_usage,
-                }
-            )
-            """
-
-            # os.remove(output_file)
-
-            """
-            correct_output = tests_response[f"{str(i)}_out"]
-
-            if output != correct_output:
-                get_docapi_table("tasks").update_item(
-                    Key={"task_id": task_id},
-                    AttributeUpdates={
-                        "status": {"Value": "DONE", "Action": "PUT"},
-                        "result": {"Value": "WA", "Action": "PUT"},
-                        "test_failed": {"Value": f"{i}", "Action": "PUT"},
-                        # "output": {"Value": f"{str(e)}", "Action": "PUT"},
-                    },
-                )
-                return
-            """
-        # finally:
-        # Restore original memory limit
-        # set_memory_limit(resource.RLIM_INFINITY)
-    # TODO -- avg memory usage
-    avg_time_usage = sum(time_limits) / len(time_limits)
-    avg_memory_usage = sum(memory_limits) / len(memory_limits)
+SELECT task_id FROM `Results` WHERE task_id = $task_id;
 
-    min_time_usage = min(time_limits)
-    max_time_usage = max(time_limits)
+SELECT total, version, time_sketch, memory_sketch
+FROM `TaskStats`
+WHERE contest = $contest AND task_n = $task_n;
 
-    min_memory_usage = min(memory_limits)
-    max_memory_usage = max(memory_limits)
+SELECT tasks FROM `Standings` WHERE contest = $contest AND `user` = $user;
+"""
 
-    contest, task_n = key_test.split("_")
-    task_n = int(task_n)
+SAVE_RESULT_WRITE_YQL = """
+DECLARE $task_id AS Utf8;
+DECLARE $contest AS Utf8;
+DECLARE $task_n AS Int32;
+DECLARE $code_quality AS Int32;
+DECLARE $quality_comment AS Utf8;
+DECLARE $code_style AS Int32;
+DECLARE $style_comment AS Utf8;
+DECLARE $avg_time_usage AS Double;
+DECLARE $min_time_usage AS Double;
+DECLARE $max_time_usage AS Double;
+DECLARE $avg_memory_usage AS Double;
+DECLARE $min_memory_usage AS Double;
+DECLARE $max_memory_usage AS Double;
+DECLARE $test_metrics AS String;
+DECLARE $total AS Int64;
+DECLARE $version AS Int64;
+DECLARE $time_sketch AS Utf8;
+DECLARE $memory_sketch AS Utf8;
+DECLARE $standings AS List<Struct<contest: Utf8, user_name: Utf8, solved: Int32, penalty: Int64, rank_key: Int64, tasks: Utf8>>;
+UPSERT INTO `Results` (`task_id`, `contest`, `task_n`, `code_quality`, `quality_comment`, `code_style`, `style_comment`, `avg_time_usage`, `min_time_usage`, `max_time_usage`, `avg_memory_usage`, `min_memory_usage`, `max_memory_usage`, `test_metrics`) 
+VALUES ($task_id, $contest, $task_n, $code_quality, $quality_comment, $code_style, $style_comment, $avg_time_usage, $min_time_usage, $max_time_usage, $avg_memory_usage, $min_memory_usage, $max_memory_usage, $test_metrics);
+UPSERT INTO `TaskStats` (`contest`, `task_n`, `total`, `version`, `time_sketch`, `memory_sketch`)
+VALUES ($contest, $task_n, $total, $version, $time_sketch, $memory_sketch);
+UPSERT INTO `Standings` (`contest`, `user`, `solved`, `penalty`, `rank_key`, `tasks`)
+SELECT contest, user_name, solved, penalty, rank_key, tasks FROM AS_TABLE($standings);
+"""
 
-    yql = """
-    DECLARE $task_id AS Utf8;
-    DECLARE $contest AS Utf8;
-    DECLARE $task_n AS Int32;
-    DECLARE $code_quality AS Int32;
-    DECLARE $quality_comment AS Utf8;
-    DECLARE $code_style AS Int32;
-    DECLARE $style_comment AS Utf8;
-    DECLARE $avg_time_usage AS Double;
-    DECLARE $min_time_usage AS Double;
-    DECLARE $max_time_usage AS Double;
-    DECLARE $avg_memory_usage AS Double;
-    DECLARE $min_memory_usage AS Double;
-    DECLARE $max_memory_usage AS Double;
-    UPSERT INTO `Results` (`task_id`, `contest`, `task_n`, `code_quality`, `quality_comment`, `code_style`, `style_comment`, `avg_time_usage`, `min_time_usage`, `max_time_usage`, `avg_memory_usage`, `min_memory_usage`, `max_memory_usage`) 
-    VALUES ($task_id, $contest, $task_n, $code_quality, $quality_comment, $code_style, $style_comment, $avg_time_usage, $min_time_usage, $max_time_usage, $avg_memory_usage, $min_memory_usage, $max_memory_usage);
-    """
 
-    # Yql params (change this + table + query_form for additional params)
-    params = (
-        task_id,
-        contest,
-        task_n,
-        0,
-        "_",
-        0,
-        "_",
-        avg_time_usage,
-        min_time_usage,
-        max_time_usage,
-        avg_memory_usage,
-        min_memory_usage,
-        max_memory_usage,
-    )
+def save_result(task_id, contest, task_n, usage, user=None):
+    # Results row, task aggregate and the standings row of `user` are written
+    # in one transaction, so the aggregate always matches the Results table.
+    # Two round-trips: the read begins the transaction (no separate
+    # BeginTransaction), the write commits
+    def run(session):
+        tx = session.transaction(ydb.SerializableReadWrite())
+        seen, current, standings = tx.execute(
+            session.prepare(SAVE_RESULT_READ_YQL),
+            {
+                "$task_id": task_id,
+                "$contest": contest,
+                "$task_n": task_n,
+                "$user": user,
+            },
+            settings=YDB_SETTINGS,
+        )
 
-    def add_another_test(session):
-        prepared_yql = session.prepare(yql)
-        tmp_result = session.transaction(ydb.SerializableReadWrite()).execute(
-            prepared_yql,
+        if current.rows:
+            stats = read_task_stats(current.rows[0])
+        else:
+            stats = new_task_stats()
+        # Redelivered task is already counted
+        counted = not seen.rows
+        if counted:
+            add_to_task_stats(stats, usage["avg_time_usage"], usage["avg_memory_usage"])
+        standings_rows = []
+        if counted and user is not None:
+            row = get_standings_row(standings.rows, task_n, accepted=True)
+            if row is not None:
+                standings_rows.append({"contest": contest, "user_name": user, **row})
+
+        tx.execute(
+            session.prepare(SAVE_RESULT_WRITE_YQL),
             {
-                "$task_id": params[0],
-                "$contest": params[1],
-                "$task_n": params[2],
-                "$code_quality": params[3],
-                "$quality_comment": params[4],
-                "$code_style": params[5],
-                "$style_comment": params[6],
-                "$avg_time_usage": params[7],
-                "$min_time_usage": params[8],
-                "$max_time_usage": params[9],
-                "$avg_memory_usage": params[10],
-                "$min_memory_usage": params[11],
-                "$max_memory_usage": params[12],
+                "$task_id": task_id,
+                "$contest": contest,
+                "$task_n": task_n,
+                "$code_quality": 0,
+                "$quality_comment": "_",
+                "$code_style": 0,
+                "$style_comment": "_",
+                **{f"${key}": value for key, value in usage.items()},
+                "$total": stats["total"],
+                "$version": stats["version"],
+                "$time_sketch": json.dumps(stats["time_sketch"]),
+                "$memory_sketch": json.dumps(stats["memory_sketch"]),
+                "$standings": standings_rows,
             },
             commit_tx=True,
-            # For timeouts (in case of long query), remove for testing scenario
-            settings=ydb.BaseRequestSettings()
-            .with_timeout(3)
-            .with_operation_timeout(2),
+            settings=YDB_SETTINGS,
         )
+        return stats
 
-        try:
-            print("DEBUG | Showing result for transation exectuion: \n", tmp_result)
-        except:
-            print("DEBUG | Unable to show results for transaction execution")
+    # Aborted transaction (concurrent judge of the same task) is retried
+    # from the read, so no update of the aggregate is lost
+    return get_ydb_session().retry_operation_sync(run)
 
-    get_ydb_session().retry_operation_sync(add_another_test)
 
-    # return result
-    # Uncomment for query debug
-    """
-    try:
-        print("DEBUG | Showing query results for UPSERT: \n", operation_status)
-    except:
-        print("DEBUG | Unable to show query results for UPSERT")
-    """
+# Standings of a contest (see Cloud/Db/Standings.sql): more solved tasks
+# first, then fewer rejected attempts on solved tasks. `rank_key` orders the
+# `standings_rank` index the same way, ascending
+STANDINGS_MAX_PENALTY = 10**6
 
-    yql = """
-        DECLARE $contest AS Utf8;
-        DECLARE $task_n AS Int64;
+STANDINGS_READ_YQL = """
+DECLARE $contest AS Utf8;
+DECLARE $user AS Utf8;
 
-        SELECT
-            task_id,
-            avg_time_usage,
-            avg_memory_usage
-        FROM Results
-        WHERE contest = $contest AND task_n = $task_n;
-    """
+SELECT tasks FROM `Standings` WHERE contest = $contest AND `user` = $user;
+"""
 
-    params = (contest, task_n)
+STANDINGS_WRITE_YQL = """
+DECLARE $contest AS Utf8;
+DECLARE $user AS Utf8;
+DECLARE $solved AS Int32;
+DECLARE $penalty AS Int64;
+DECLARE $rank_key AS Int64;
+DECLARE $tasks AS Utf8;
+
+UPSERT INTO `Standings` (`contest`, `user`, `solved`, `penalty`, `rank_key`, `tasks`)
+VALUES ($contest, $user, $solved, $penalty, $rank_key, $tasks);
+"""
 
-    def get_solutions(session):
-        prepared_yql = session.prepare(yql)
-        tmp_result = session.transaction(ydb.SerializableReadWrite()).execute(
-            prepared_yql,
+
+def get_standings_row(rows, task_n, accepted):
+    # New standings row of a user after a verdict on `task_n`, None if it
+    # doesn't change. Incremental: only the row of this user is read
+    tasks = json.loads(rows[0].tasks) if rows else {}
+    task = tasks.setdefault(str(task_n), {"accepted": False, "rejected": 0})
+    if task["accepted"]:
+        # Resubmissions of a solved task don't change standings
+        return None
+    if accepted:
+        task["accepted"] = True
+    else:
+        task["rejected"] += 1
+
+    solved = sum(task["accepted"] for task in tasks.values())
+    penalty = sum(task["rejected"] for task in tasks.values() if task["accepted"])
+    return {
+        "solved": solved,
+        "penalty": penalty,
+        "rank_key": min(penalty, STANDINGS_MAX_PENALTY - 1)
+        - solved * STANDINGS_MAX_PENALTY,
+        "tasks": json.dumps(tasks),
+    }
+
+
+def update_standings(contest, user, task_n, accepted):
+    # Accepts of judged solutions go with their Results row (`save_result`),
+    # this one is for rejections and verdicts copied from earlier submissions
+    def run(session):
+        tx = session.transaction(ydb.SerializableReadWrite())
+        current = tx.execute(
+            session.prepare(STANDINGS_READ_YQL),
+            {"$contest": contest, "$user": user},
+            settings=YDB_SETTINGS,
+        )[0]
+
+        row = get_standings_row(current.rows, task_n, accepted)
+        if row is None:
+            tx.rollback()
+            return
+        tx.execute(
+            session.prepare(STANDINGS_WRITE_YQL),
             {
                 "$contest": contest,
-                "$task_n": task_n,
+                "$user": user,
+                **{f"${key}": value for key, value in row.items()},
             },
             commit_tx=True,
-            settings=ydb.BaseRequestSettings()
-            .with_timeout(3)
-            .with_operation_timeout(2),
+            settings=YDB_SETTINGS,
         )
 
-        try:
-            print("DEBUG | Showing result for transation-2 exectuion: \n", tmp_result)
-        except:
-            print("DEBUG | Unable to show results for transaction-2 execution")
+    try:
+        get_ydb_session().retry_operation_sync(run)
+    except Exception as e:
+        # Verdict is already stored, standings are secondary
+        print(f"DEBUG | Unable to update standings of {contest}/{user}: {e!r}")
 
-        solutions = [
-            {
-                "avg_time_usage": row.avg_time_usage,
-                "avg_memory_usage": row.avg_memory_usage,
-                "task_id": row.task_id,
-            }
-            for row in tmp_result[0].rows
-        ]
 
-        return solutions
+def report_verdict(task_id, verdict, test, output=None):
+    attribute_updates = {
+        "status": {"Value": "DONE", "Action": "PUT"},
+        "result": {"Value": verdict, "Action": "PUT"},
+    }
+    if test is not None:
+        attribute_updates["test_failed"] = {"Value": f"{test}", "Action": "PUT"}
+    if output is not None:
+        attribute_updates["output"] = {"Value": f"{output}", "Action": "PUT"}
 
-    solutions = get_ydb_session().retry_operation_sync(get_solutions)
+    get_docapi_table("tasks").update_item(
+        Key={"task_id": task_id}, AttributeUpdates=attribute_updates
+    )
+    return attribute_updates
 
-    yql = """
-        DECLARE $task_id AS String;
 
-        SELECT
-            avg_time_usage,
-            avg_memory_usage
-        FROM solutions
-        WHERE task_id = $task_id;
-    """
+def get_task_option(tests_response, contest, option):
+    # Task-level setting (attribute in `tests` table) wins over the contest-level
+    # one, which is a comma-separated env list, e.g. `PARALLEL_CONTESTS=basic,dsa`
+    value = tests_response.get(option)
+    if value is None:
+        contests = os.getenv(f"{option.upper()}_CONTESTS", "").split(",")
+        return contest in contests
+    return str(value).lower() in ["1", "true", "yes", "on"]
 
-    # For monitoring mostly since here we have avg_X_metrics already!
-    def get_user_solution(session):
-        prepared_yql = session.prepare(yql)
-        result = session.transaction(ydb.SerializableReadWrite()).execute(
-            prepared_yql,
-            {
-                "$task_id": task_id,
-            },
-            commit_tx=True,
-            settings=ydb.BaseRequestSettings()
-            .with_timeout(3)
-            .with_operation_timeout(2),
+
+# Messages of one trigger batch judged at once; each one may in turn run its
+# tests in parallel (see `get_pool_size`)
+JUDGE_CONCURRENCY = max(1, int(os.getenv("JUDGE_CONCURRENCY", "2")))
+
+
+def get_pool_size(memory_limit):
+    # Bounded by both free cores and memory budget of a container (`ml` per test)
+    if os.getenv("JUDGE_WORKERS"):
+        return max(1, int(os.getenv("JUDGE_WORKERS")))
+
+    # Cores are shared by the messages judged at once
+    cpu_count = len(os.sched_getaffinity(0)) // JUDGE_CONCURRENCY
+    memory_available = psutil.virtual_memory().available // (1024 * 1024)
+    memory_slots = memory_available // max(memory_limit, 1)
+    return max(1, min(cpu_count, memory_slots))
+
+
+# Sandbox of a solution: rlimits + unprivileged user (root ignores NPROC).
+# RLIMIT_RSS is a no-op on Linux, so `ml` is enforced as address space with
+# some slack for the runtime itself, and checked precisely against `maxrss`
+SANDBOX_UID = int(os.getenv("SANDBOX_UID", "65534"))
+SANDBOX_AS_SLACK = int(os.getenv("SANDBOX_AS_SLACK_MB", "64"))
+SANDBOX_NPROC = int(os.getenv("SANDBOX_NPROC", "64"))
+SANDBOX_NOFILE = int(os.getenv("SANDBOX_NOFILE", "64"))
+SANDBOX_FSIZE = int(os.getenv("SANDBOX_FSIZE_MB", "64"))
+
+
+def get_sandbox_limits(tests_response):
+    memory_limit = int(tests_response["ml"])
+    # SIGXCPU at the soft limit, SIGKILL at the hard one
+    cpu_limit = math.ceil(float(tests_response["tl"])) + 1
+    limits = {
+        "RLIMIT_AS": [(memory_limit + SANDBOX_AS_SLACK) * 1024 * 1024] * 2,
+        "RLIMIT_CPU": [cpu_limit, cpu_limit + 1],
+        "RLIMIT_NPROC": [SANDBOX_NPROC] * 2,
+        "RLIMIT_NOFILE": [SANDBOX_NOFILE] * 2,
+        "RLIMIT_FSIZE": [SANDBOX_FSIZE * 1024 * 1024] * 2,
+        "RLIMIT_CORE": [0, 0],
+    }
+    uid = SANDBOX_UID if os.geteuid() == 0 else None
+    return {"rlimits": limits, "uid": uid}
+
+
+def is_memory_error(usage, memory_limit):
+    if usage["memory"] > memory_limit:
+        return True
+    # Allocation failed at the RLIMIT_AS boundary
+    if usage["returncode"] != 0:
+        return any(
+            marker in usage["error"] for marker in ["MemoryError", "std::bad_alloc"]
+        )
+    return False
+
+
+def is_output_error(usage):
+    if usage["returncode"] == -signal.SIGXFSZ:
+        return True
+    # Python ignores SIGXFSZ, write fails with EFBIG instead
+    return usage["returncode"] != 0 and "File too large" in usage["error"]
+
+
+# Solution is started through a tiny trampoline: a child forked from this
+# process inherits its RSS (numpy, matplotlib, ...) into `ru_maxrss`, while a
+# grandchild forked from `python3 -S` starts from a few MB. The trampoline
+# reaps the solution with `wait4` and writes its own rusage into a pipe.
+RUSAGE_TRAMPOLINE = """
+import json, os, resource, sys, time, traceback
+fd = int(sys.argv[1])
+sandbox = json.loads(sys.argv[2])
+# A failed setup or exec is written here (closed on exec, so empty otherwise):
+# it's a fault of the judge, not of the solution
+error_read, error_write = os.pipe()
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.close(fd)
+    os.close(error_read)
+    try:
+        for name, limit in sandbox["rlimits"].items():
+            resource.setrlimit(getattr(resource, name), tuple(limit))
+        if sandbox["uid"] is not None:
+            os.setgroups([])
+            os.setgid(sandbox["uid"])
+            os.setuid(sandbox["uid"])
+        os.execvp(sys.argv[3], sys.argv[3:])
+    except BaseException:
+        traceback.print_exc()
+        sys.stderr.flush()
+        os.write(error_write, b"1")
+    finally:
+        os._exit(127)
+os.close(error_write)
+_, status, usage = os.wait4(pid, 0)
+wall_time = time.perf_counter() - start
+sandbox_error = len(os.read(error_read, 1))
+report = [status, usage.ru_utime, usage.ru_stime, usage.ru_maxrss, wall_time]
+report.append(sandbox_error)
+os.write(fd, " ".join(map(str, report)).encode())
+"""
+
+
+def run_measured(args, stdin, stdout, time_limit, sandbox):
+    # Per-child accounting: rusage of `wait4` belongs to this child only, unlike
+    # RUSAGE_CHILDREN which is a sum / lifetime maximum over all of them.
+    # TL is enforced against CPU time (`tl`) and wall time (`tl` * factor).
+    wall_limit = time_limit * float(os.getenv("WALL_TIME_FACTOR", "2"))
+    lock = threading.Lock()
+    state = {"reaped": False, "killed": False}
+
+    # `stdin` is a path of a test file or a mapped region of a test bundle,
+    # the latter is fed straight from memory through a pipe
+    stdin_data = None
+    if isinstance(stdin, memoryview):
+        stdin_data = stdin
+
+    read_fd, write_fd = os.pipe()
+    stderr = tempfile.TemporaryFile()
+    start_time = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if stdin_data is None:
+            stdin = stack.enter_context(open(stdin, "rb"))
+        else:
+            stdin = subprocess.PIPE
+        process = subprocess.Popen(
+            [
+                "python3",
+                "-S",
+                "-c",
+                RUSAGE_TRAMPOLINE,
+                str(write_fd),
+                json.dumps(sandbox),
+            ]
+            + args,
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr,
+            pass_fds=[write_fd],
+            start_new_session=True,
+        )
+    os.close(write_fd)
+
+    def kill():
+        with lock:
+            if not state["reaped"]:
+                state["killed"] = True
+                os.killpg(process.pid, signal.SIGKILL)
+
+    feeder = None
+    if stdin_data is not None:
+        feeder = threading.Thread(
+            target=feed_stdin, args=(process.stdin, stdin_data), daemon=True
+        )
+        feeder.start()
+
+    timer = threading.Timer(wall_limit, kill)
+    timer.start()
+    try:
+        with os.fdopen(read_fd, "rb") as report_file:
+            report = report_file.read().decode().split()
+        # Wait without reaping first, so the group id can't be reused yet
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        end_time = time.perf_counter()
+        with lock:
+            state["reaped"] = True
+        # Leftovers of a solution (e.g. forked children) go with the group
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    finally:
+        timer.cancel()
+        if feeder is not None:
+            feeder.join()
+
+    with stderr:
+        error = read_tail(stderr)
+
+    if not report:
+        # Killed by the timer before the solution finished
+        return {
+            "returncode": -signal.SIGKILL,
+            "user_time": 0.0,
+            "system_time": 0.0,
+            "cpu_time": 0.0,
+            "wall_time": end_time - start_time,
+            "memory": 0.0,
+            "timed_out": True,
+            "sandbox_error": False,
+            "error": error,
+        }
+
+    status, user_time, system_time, max_rss, wall_time, sandbox_error = report
+    cpu_time = float(user_time) + float(system_time)
+    return {
+        "returncode": os.waitstatus_to_exitcode(int(status)),
+        "user_time": float(user_time),
+        "system_time": float(system_time),
+        "cpu_time": cpu_time,
+        "wall_time": float(wall_time),
+        # KB on Linux
+        "memory": int(max_rss) / 1024,
+        "timed_out": state["killed"] or cpu_time > time_limit,
+        "sandbox_error": sandbox_error == "1",
+        "error": error,
+    }
+
+
+# ---
+# Zygote (fork server for Python solutions, see zygote.py)
+# ---
+
+zygote = None
+zygote_lock = threading.Lock()
+
+
+def get_zygote():
+    global zygote
+    with zygote_lock:
+        if zygote is not None and zygote["process"].poll() is None:
+            return zygote
+
+        judge_sock, zygote_sock = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_SEQPACKET
         )
+        process = subprocess.Popen(
+            [
+                "python3",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py"),
+                str(zygote_sock.fileno()),
+            ],
+            pass_fds=[zygote_sock.fileno()],
+        )
+        zygote_sock.close()
+        ready = json.loads(judge_sock.recv(65536))
+        print(f"DEBUG | Zygote started, warmup time = {ready['warmup_time']:.3f}s")
+
+        zygote = {
+            "process": process,
+            "sock": judge_sock,
+            "warmup_time": ready["warmup_time"],
+            "send_lock": threading.Lock(),
+            "pending": {},
+            "next_id": 0,
+        }
+        threading.Thread(
+            target=read_zygote_reports, args=(zygote,), daemon=True
+        ).start()
+        return zygote
+
+
+def read_zygote_reports(current):
+    while True:
+        message = current["sock"].recv(65536)
+        if not message:
+            break
+        report = json.loads(message)
+        waiter = current["pending"].pop(report["id"], None)
+        if waiter is not None:
+            waiter["report"] = report
+            waiter["event"].set()
+
+    # Zygote is dead, tests waiting for it will fail as UB
+    for waiter in list(current["pending"].values()):
+        waiter["event"].set()
+
+
+def run_in_zygote(args, stdin, stdout, time_limit, sandbox):
+    # Same contract as `run_measured`, `args[-1]` is a path to solution.py
+    wall_limit = time_limit * float(os.getenv("WALL_TIME_FACTOR", "2"))
+    current = get_zygote()
+
+    stderr = tempfile.TemporaryFile()
+    feeder = None
+    with contextlib.ExitStack() as stack:
+        if isinstance(stdin, memoryview):
+            read_fd, write_fd = os.pipe()
+            stdin_file = stack.enter_context(os.fdopen(read_fd, "rb"))
+            stdin_pipe = open(write_fd, "wb")
+            feeder = threading.Thread(
+                target=feed_stdin, args=(stdin_pipe, stdin), daemon=True
+            )
+        else:
+            stdin_file = stack.enter_context(open(stdin, "rb"))
+
+        waiter = {"event": threading.Event(), "report": None}
+        with current["send_lock"]:
+            request_id = current["next_id"]
+            current["next_id"] += 1
+            current["pending"][request_id] = waiter
+            request = {
+                "id": request_id,
+                "path": args[-1],
+                "wall_limit": wall_limit,
+                "sandbox": sandbox,
+            }
+            socket.send_fds(
+                current["sock"],
+                [json.dumps(request).encode()],
+                [stdin_file.fileno(), stdout.fileno(), stderr.fileno()],
+            )
 
-        return result[0]
+    if feeder is not None:
+        feeder.start()
+    # Zygote kills a solution on its own, the extra wait is for a stuck zygote
+    waiter["event"].wait(wall_limit + 5)
+    if feeder is not None:
+        feeder.join()
+
+    with stderr:
+        error = read_tail(stderr)
+
+    report = waiter["report"]
+    if report is None:
+        current["pending"].pop(request_id, None)
+        raise Exception("Zygote didn't report the test result")
+
+    cpu_time = report["user_time"] + report["system_time"]
+    return {
+        "returncode": os.waitstatus_to_exitcode(report["status"]),
+        "user_time": report["user_time"],
+        "system_time": report["system_time"],
+        "cpu_time": cpu_time,
+        "wall_time": report["wall_time"],
+        # KB on Linux
+        "memory": report["max_rss"] / 1024,
+        "startup_time": report["startup_time"],
+        "timed_out": report["killed"] or cpu_time > time_limit,
+        "sandbox_error": report["sandbox_error"],
+        "error": error,
+    }
+
+
+def run_test(
+    task_id, key_test, tests_response, i, command, runner=run_measured, bundle=None
+):
+    time_limit = int(tests_response["tl"])
+    memory_limit = int(tests_response["ml"])
+    sandbox = get_sandbox_limits(tests_response)
+    version = tests_response.get("version")
+    # NOTE: We work in read-only fs, so we use
+    # temporary files
+    try:
+        test_files = download_from_bucket(key_test, str(i), version, bundle)
+        if not test_files:
+            raise Exception(f"Unable to download test #{i}")
+        test_input, test_output = test_files
+
+        # Run the program with a timeout and memory limit
+        with tempfile.NamedTemporaryFile() as output_temp:
+            usage = runner(command, test_input, output_temp, time_limit, sandbox)
+            print(f"DEBUG | TEST_{i} usage: {usage}")
+
+            if usage["sandbox_error"]:
+                # Solution never started, exit code 127 isn't its own
+                raise Exception(f"Unable to start the solution\n{usage['error']}")
+            if usage["timed_out"] or usage["returncode"] == -signal.SIGXCPU:
+                raise subprocess.TimeoutExpired(
+                    command, time_limit, stderr=usage["error"]
+                )
+            if is_memory_error(usage, memory_limit):
+                raise MemoryError(
+                    f"Memory usage {usage['memory']:.1f} MB, limit {memory_limit} MB"
+                    f"\n{usage['error']}"
+                )
+            if is_output_error(usage):
+                return {
+                    "test": i,
+                    "result": "OL",
+                    "output": f"Output exceeds {SANDBOX_FSIZE} MB",
+                }
+            if usage["returncode"] != 0:
+                raise subprocess.CalledProcessError(
+                    usage["returncode"], command, stderr=usage["error"]
+                )
 
-    # Uncomment for debug!
-    # cur_solution = get_ydb_session().retry_operation_sync(get_user_solution)
+            mismatch = compare_outputs(
+                output_temp.name, test_output, tests_response.get("checker", "tokens")
+            )
+            if mismatch is not None:
+                return {"test": i, "result": "WA", "output": mismatch["description"]}
+
+    except subprocess.CalledProcessError as e:
+        # Runtime error (non-zero exit code)
+        return {"test": i, "result": "RE", "output": f"{str(e)}\n{e.stderr}"}
+    except MemoryError as e:
+        # Memory limit
+        return {"test": i, "result": "ML", "output": str(e)}
+    except subprocess.TimeoutExpired as e:
+        # Time limit
+        return {"test": i, "result": "TL", "output": str(e)}
+    except Exception as e:
+        # Other errors
+        return {"test": i, "result": "UB", "output": str(e)}
+
+    return {
+        "test": i,
+        "result": "OK",
+        "time": usage["cpu_time"],
+        "memory": usage["memory"],
+        "user_time": usage["user_time"],
+        "system_time": usage["system_time"],
+        "wall_time": usage["wall_time"],
+        "startup_time": usage.get("startup_time"),
+    }
+
+
+def feed_stdin(pipe, data):
     try:
-        plot_graphs_alternative(
-            solutions, task_id, avg_time_usage, avg_memory_usage, contest, task_n
+        with pipe:
+            pipe.write(data)
+    except BrokenPipeError:
+        # Solution exited without reading the whole input
+        pass
+
+
+def read_tail(file_obj, limit=4096):
+    # Last `limit` bytes only, stderr of a solution can be arbitrarily large
+    file_obj.seek(0, os.SEEK_END)
+    file_obj.seek(max(file_obj.tell() - limit, 0))
+    return file_obj.read().decode(errors="replace")
+
+
+def run_tests_sequential(tests, run_one):
+    # Tests may come in any order (see `order_tests`): after a failure only
+    # tests with a lower index can still change the verdict
+    results = []
+    first_failed = None
+    for i in tests:
+        if first_failed is not None and i > first_failed:
+            continue
+        print(f"DEBUG | TEST_{i} started!")
+        result = run_one(i)
+        results.append(result)
+        if result["result"] != "OK":
+            first_failed = i
+    return sorted(results, key=lambda result: result["test"])
+
+
+def run_tests_parallel(tests, run_one, pool_size):
+    # Tests are independent, so any order of completion is fine: the verdict is
+    # the failed test with the lowest index, exactly as in sequential mode.
+    # Tests after an already failed one can't change it and are cancelled.
+    results = []
+    first_failed = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor:
+        futures = {executor.submit(run_one, i): i for i in tests}
+        for future in concurrent.futures.as_completed(futures):
+            if future.cancelled():
+                continue
+            result = future.result()
+            results.append(result)
+            if result["result"] != "OK" and (
+                first_failed is None or result["test"] < first_failed
+            ):
+                first_failed = result["test"]
+                for pending, i in futures.items():
+                    if i > first_failed:
+                        pending.cancel()
+
+    return sorted(results, key=lambda result: result["test"])
+
+
+def order_tests(tests, tests_response):
+    # Most often failing ("killer") tests first, see `record_failure`
+    return sorted(tests, key=lambda i: (-int(tests_response.get(f"fail_{i}", 0)), i))
+
+
+def record_failure(key_test, test):
+    # Per-test counters of verdicts live in the `tests` item of a task
+    try:
+        get_tests_table().update_item(
+            Key={"test_id": key_test},
+            AttributeUpdates={f"fail_{test}": {"Value": 1, "Action": "ADD"}},
         )
     except Exception as e:
-        print(f"DEBUG | Countered error while plotting graphs, info: {str(e)}!")
+        print(f"DEBUG | Unable to record failure of test #{test}: {e!r}")
+
+
+def run_solution(
+    command, tests_response, task_id, key_test, runner=run_measured, user=None
+):
+    print(tests_response)
+    tests_total = int(tests_response["total"])
+    memory_limit = int(tests_response["ml"])
+    version = tests_response.get("version")
+    contest, task_n = key_test.split("_")
+
+    # Whole task in one request if a bundle exists, per-file tests otherwise
+    bundle = open_test_bundle(key_test, version)
+    if bundle is not None:
+        tests_total = len(bundle["index"])
+
+    def run_one(i):
+        return run_test(task_id, key_test, tests_response, i, command, runner, bundle)
+
+    tests = range(1, tests_total + 1)
+    if get_task_option(tests_response, contest, "fail_fast"):
+        tests = order_tests(tests, tests_response)
+        print(f"DEBUG | Fail-fast order: {tests}")
+    # Parallel mode is opt-in: some tasks need exclusive-core timing
+    if get_task_option(tests_response, contest, "parallel"):
+        pool_size = get_pool_size(memory_limit)
+        print(f"DEBUG | Running {tests_total} tests with pool size = {pool_size}")
+        results = run_tests_parallel(tests, run_one, pool_size)
+    else:
+        results = run_tests_sequential(tests, run_one)
+
+    for result in results:
+        if result["result"] != "OK":
+            attribute_updates = report_verdict(
+                task_id, result["result"], result["test"], result["output"]
+            )
+            # Internal errors say nothing about the tests (nor the user)
+            if result["result"] != "UB":
+                record_failure(key_test, result["test"])
+                if user is not None:
+                    update_standings(contest, user, task_n, accepted=False)
+            return attribute_updates
+
+    print(f"DEBUG | Test cache: {get_test_cache_stats()}")
+    print("DEBUG | Passed all tests, proceeding to ydb & graphs...")
+    time_limits = [result["time"] for result in results]
+    memory_limits = [result["memory"] for result in results]
+
+    # TODO -- avg memory usage
+    avg_time_usage = sum(time_limits) / len(time_limits)
+    avg_memory_usage = sum(memory_limits) / len(memory_limits)
+
+    min_time_usage = min(time_limits)
+    max_time_usage = max(time_limits)
+
+    min_memory_usage = min(memory_limits)
+    max_memory_usage = max(memory_limits)
+
+    task_n = int(task_n)
+
+    stats = save_result(
+        task_id,
+        contest,
+        task_n,
+        {
+            "avg_time_usage": avg_time_usage,
+            "min_time_usage": min_time_usage,
+            "max_time_usage": max_time_usage,
+            "avg_memory_usage": avg_memory_usage,
+            "min_memory_usage": min_memory_usage,
+            "max_memory_usage": max_memory_usage,
+            "test_metrics": pack_test_metrics(results),
+        },
+        user,
+    )
+    print(
+        f"DEBUG | Task stats v{stats['version']}: {stats['total']} solutions, "
+        f"time p50 = {sketch_quantile(stats['time_sketch'], 0.5)}, "
+        f"memory p50 = {sketch_quantile(stats['memory_sketch'], 0.5)}"
+    )
+
+    # NOTE: Graphs are rendered on request by the bot (see TelegramBot/graphs.py)
 
     # Add or remove info for your system (if you need additional metrics)
+    attribute_updates = {
+        "status": {"Value": "DONE", "Action": "PUT"},
+        "result": {"Value": "OK", "Action": "PUT"},
+        "avg_time_limit": {"Value": f"{avg_time_usage}", "Action": "PUT"},
+        "avg_memory_limit": {"Value": f"{avg_memory_usage}", "Action": "PUT"},
+        "min_time_limit": {"Value": f"{min_time_usage}", "Action": "PUT"},
+        "min_memory_limit": {"Value": f"{min_memory_usage}", "Action": "PUT"},
+        "max_time_limit": {"Value": f"{max_time_usage}", "Action": "PUT"},
+        "max_memory_limit": {"Value": f"{max_memory_usage}", "Action": "PUT"},
+        # "test_failed": {"Value": f"i", "Action": "PUT"},
+        # "output": {"Value": f"{str(e)}", "Action": "PUT"},
+    }
+    # Spawn cost of the zygote, reported apart from time of solution itself
+    startup_times = [
+        result["startup_time"]
+        for result in results
+        if result.get("startup_time") is not None
+    ]
+    if startup_times:
+        attribute_updates["avg_startup_time"] = {
+            "Value": f"{sum(startup_times) / len(startup_times)}",
+            "Action": "PUT",
+        }
     get_docapi_table("tasks").update_item(
-        Key={"task_id": task_id},
-        AttributeUpdates={
-            "status": {"Value": "DONE", "Action": "PUT"},
-            "result": {"Value": "OK", "Action": "PUT"},
-            "avg_time_limit": {"Value": f"{avg_time_usage}", "Action": "PUT"},
-            "avg_memory_limit": {"Value": f"{avg_memory_usage}", "Action": "PUT"},
-            "min_time_limit": {"Value": f"{min_time_usage}", "Action": "PUT"},
-            "min_memory_limit": {"Value": f"{min_memory_usage}", "Action": "PUT"},
-            "max_time_limit": {"Value": f"{max_time_usage}", "Action": "PUT"},
-            "max_memory_limit": {"Value": f"{max_memory_usage}", "Action": "PUT"},
-            # "test_failed": {"Value": f"i", "Action": "PUT"},
-            # "output": {"Value": f"{str(e)}", "Action": "PUT"},
-        },
+        Key={"task_id": task_id}, AttributeUpdates=attribute_updates
     )
 
     # Clean up the output file
     # os.remove(output_file)
-    # return results
-    return
+    # Attributes of the verdict, as written to the tasks table
+    return attribute_updates
 
 
 def get_memory_usage():
@@ -868,91 +1642,247 @@ def process_standart(task_json):
 """
 
 
-def handler(event, context):
-    for message in event["messages"]:
-        print(message)
-        task_json = None
-        processing = "standart"
-        try:
-            task_json = json.loads(message["details"]["message"]["body"])
-        except:
-            print("DEBUG | Unknown message format, check YMQ docs!")
-            return
+# Identical solution of the same task version gets the stored verdict of the
+# first one instead of being judged again (`verdicts` DocAPI table, see
+# Setup/Terraform/setup-db.sh). Set DEDUP_VERDICTS=0 to judge everything
+DEDUP_VERDICTS = os.getenv("DEDUP_VERDICTS", "1") == "1"
+SOURCE_FILES = {"python": "solution.py", "cpp": "solution.cpp"}
+# Besides the source, verdict depends on these fields of the tests item
+DEDUP_TESTS_FIELDS = ["version", "tl", "ml", "checker"]
+# Never stored, the next identical solution is judged: internal errors, and
+# limits, which depend on the load of the machine the solution ran on
+DEDUP_SKIP_VERDICTS = ["UB", "TL", "ML"]
+
+
+def normalize_source(source):
+    # Only what can't change behaviour: BOM, line endings, blank lines at the
+    # end. Trailing spaces stay, they may be inside a string literal
+    if source.startswith(b"\xef\xbb\xbf"):
+        source = source[3:]
+    return source.replace(b"\r\n", b"\n").rstrip(b"\n")
+
+
+def get_source_hash(task_id, contest, task_n, language, tests_response):
+    # Every extracted file counts (a solution may import its own modules or
+    # read data files): sorted relative paths with normalized contents
+    directory = pathlib.Path(f"/tmp/{task_id}")
+    # Without a version, tests may change under the same key: nothing to share
+    if tests_response.get("version") is None:
+        return None
+    if (
+        language not in SOURCE_FILES
+        or not (directory / SOURCE_FILES[language]).is_file()
+    ):
+        return None
+
+    source_hash = hashlib.sha256()
+    for path in sorted(directory.rglob("*")):
+        relative_path = path.relative_to(directory).as_posix().encode()
+        # The archive itself is what was extracted, caches are not the solution
+        if not path.is_file() or relative_path == b"solution.zip":
+            continue
+        if "__pycache__" in path.parts:
+            continue
+        source = normalize_source(path.read_bytes())
+        source_hash.update(
+            b"%d\0%s\0%d\0" % (len(relative_path), relative_path, len(source))
+        )
+        source_hash.update(source)
+    task_key = [contest, task_n, language]
+    task_key += [tests_response.get(field) for field in DEDUP_TESTS_FIELDS]
+    source_hash.update(b"\0" + "\0".join(str(value) for value in task_key).encode())
+    return source_hash.hexdigest()
+
+
+def copy_stored_verdict(task_id, source_hash):
+    # Returns the copied verdict, None if there is nothing stored
+    stored = (
+        get_docapi_table("verdicts")
+        .get_item(Key={"source_hash": source_hash})
+        .get("Item")
+    )
+    if stored is None:
+        return None
+
+    verdict = json.loads(stored["verdict"])
+    attribute_updates = {
+        key: {"Value": value, "Action": "PUT"} for key, value in verdict.items()
+    }
+    attribute_updates["deduplicated_from"] = {
+        "Value": stored["task_id"],
+        "Action": "PUT",
+    }
+    get_docapi_table("tasks").update_item(
+        Key={"task_id": task_id}, AttributeUpdates=attribute_updates
+    )
+    return verdict
 
-        task_id = None
-        src_url = None
-        course = None
-        contest = None
-        language = None
-        task_n = None
-        if processing == "standart":
-            task_id = task_json["task_id"]
-            src_url = task_json["src_url"]
-            course = task_json["course"]
-            contest = task_json["contest"]
-            language = task_json["language"]
-            task_n = task_json["task_n"]
-        else:
-            return
-            # TODO
 
+def store_verdict(task_id, source_hash, attribute_updates):
+    # `attribute_updates` are the ones the verdict was written to the task with
+    verdict = {key: update["Value"] for key, update in attribute_updates.items()}
+    if verdict.get("status") != "DONE" or verdict.get("result") in DEDUP_SKIP_VERDICTS:
+        return
+
+    get_docapi_table("verdicts").put_item(
+        Item={
+            "source_hash": source_hash,
+            "task_id": task_id,
+            "verdict": json.dumps(verdict, default=str),
+        }
+    )
+
+
+# Failed message is put back into the queue this many times, then given up
+MAX_REDELIVERIES = int(os.getenv("MAX_REDELIVERIES", "3"))
+
+
+class MalformedMessage(Exception):
+    # Redelivery won't help: message is logged and dropped
+    pass
+
+
+def parse_message(message):
+    try:
+        task_json = json.loads(message["details"]["message"]["body"])
+        for key in ["task_id", "src_url", "course", "contest", "language", "task_n"]:
+            task_json[key]
+    except Exception as e:
+        raise MalformedMessage(f"Unknown message format, check YMQ docs! ({e!r})")
+    return task_json
+
+
+def process_message(task_json):
+    task_id = task_json["task_id"]
+    src_url = task_json["src_url"]
+    course = task_json["course"]
+    contest = task_json["contest"]
+    language = task_json["language"]
+    task_n = task_json["task_n"]
+    # Optional: submissions without a user don't get into standings
+    user = task_json.get("user")
+
+    get_docapi_table("tasks").update_item(
+        Key={"task_id": task_id},
+        AttributeUpdates={
+            "status": {"Value": "PROCESSING", "Action": "PUT"},
+        },
+    )
+
+    path = f"/tmp/{task_id}/solution.zip"
+
+    is_input_valid = download_from_ya_disk(src_url, path, language)
+    if not is_input_valid:
         get_docapi_table("tasks").update_item(
             Key={"task_id": task_id},
             AttributeUpdates={
-                "status": {"Value": "PROCESSING", "Action": "PUT"},
+                "status": {"Value": "REQS_NOT_PASSED", "Action": "PUT"},
             },
         )
+        return
+
+    key_test = str(contest) + "_" + str(task_n)
+    tests_response = get_tests_table().get_item(Key={"test_id": key_test})["Item"]
 
-        path = f"/tmp/{task_id}/solution.zip"
-        # path = "/tmp/solution.zip"
-
-        is_input_valid = None
-        if processing == "standart":
-            is_input_valid = download_from_ya_disk(src_url, path, language)
-            if not is_input_valid:
-                get_docapi_table("tasks").update_item(
-                    Key={"task_id": task_id},
-                    AttributeUpdates={
-                        "status": {"Value": "REQS_NOT_PASSED", "Action": "PUT"},
-                    },
+    source_hash = None
+    if DEDUP_VERDICTS:
+        source_hash = get_source_hash(
+            task_id, contest, task_n, language, tests_response
+        )
+    if source_hash is not None:
+        verdict = copy_stored_verdict(task_id, source_hash)
+        if verdict is not None:
+            print(f"DEBUG | Task {task_id}: same solution judged before, skipped")
+            # Counted as a judged one (compile errors never are)
+            if user is not None and verdict["result"] != "CE":
+                update_standings(
+                    contest, user, int(task_n), accepted=verdict["result"] == "OK"
                 )
-                return
-        else:
-            # download_from_bucket(task_json)
-            # is_input_valid = validate_input("/tmp/image.jpg")
             return
 
+    if language == "cpp":
+        attribute_updates = run_cpp(tests_response, task_id, key_test, user)
+    elif language == "python":
+        attribute_updates = run_python(tests_response, task_id, key_test, user)
+    else:
+        attribute_updates = report_verdict(
+            task_id, "UB", None, f"Unsupported language: {language}"
+        )
+
+    if source_hash is not None and attribute_updates is not None:
         try:
-            test_id = "basic_1"
-            get_tests_table().update_item(
-                Key={"test_id": test_id},
-                AttributeUpdates={
-                    "total": {"Value": "2", "Action": "PUT"},
-                    "tl": {"Value": "100", "Action": "PUT"},
-                    "ml": {"Value": "1000", "Action": "PUT"},
-                },
-            )
-            """
-            Item={
-                    "test_id": "basic_1",
-                    "total": 2,
-                    "tl": 100,
-                    "ml": 1000,
-                }
-            """
-            print("DEBUG| Put_item --> OK!")
-        except:
-            # ...
-            print("DEBUG | Put_item --> Error!")
-
-        key_test = str(contest) + "_" + str(task_n)
-        tests_response = get_tests_table().get_item(Key={"test_id": key_test})["Item"]
-
-        if language == "cpp":
-            results = run_cpp(tests, task_id)
-        elif language == "python":
-            results = run_python(tests_response, task_id, key_test)
+            store_verdict(task_id, source_hash, attribute_updates)
+        except Exception as e:
+            # Verdict itself is reported, the next identical solution is judged
+            print(f"DEBUG | Unable to store verdict of {task_id}: {e!r}")
+
+
+def redeliver_message(task_json):
+    # YMQ trigger can only retry a whole batch, so a failed message is sent
+    # back on its own with an attempt counter; the rest of the batch is acked
+    attempt = int(task_json.get("attempt", 0)) + 1
+    if attempt > MAX_REDELIVERIES:
+        print(f"DEBUG | Task {task_json['task_id']} failed {attempt} times, giving up")
+        report_verdict(
+            task_json["task_id"], "UB", None, "Internal error, retries exhausted"
+        )
+        return False
+
+    get_ymq_queue().send_message(
+        MessageBody=json.dumps({**task_json, "attempt": attempt}),
+        DelaySeconds=min(2**attempt, 60),
+    )
+    return True
+
+
+def handle_message(message):
+    # Returns None on success, error text on failure to be redelivered
+    try:
+        task_json = parse_message(message)
+    except MalformedMessage as e:
+        print(f"DEBUG | {e}: {message}")
+        return None
+
+    try:
+        process_message(task_json)
+    except Exception as e:
+        print(f"DEBUG | Task {task_json['task_id']} failed: {e!r}")
+        return repr(e)
+    return None
+
+
+def handler(event, context):
+    messages = event["messages"]
+    print(f"DEBUG | Batch of {len(messages)} message(s)")
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(JUDGE_CONCURRENCY, max(len(messages), 1))
+    ) as executor:
+        errors = list(executor.map(handle_message, messages))
+
+    # Only failed messages go back into the queue, by the judge itself: the
+    # batch is acked as a whole. If even that is impossible, the exception
+    # makes the trigger redeliver the whole batch
+    requeued = []
+    given_up = []
+    not_requeued = []
+    for message, error in zip(messages, errors):
+        if error is None:
+            continue
+        message_id = message["details"]["message"]["message_id"]
+        try:
+            is_requeued = redeliver_message(parse_message(message))
+        except Exception as e:
+            print(f"DEBUG | Message {message_id} was not requeued: {e!r}")
+            not_requeued.append(message_id)
+            continue
+        if is_requeued:
+            requeued.append(message_id)
         else:
-            raise ValueError("Unsupported language")
+            given_up.append(message_id)
 
-    return
+    if not_requeued:
+        raise RuntimeError(f"Messages not requeued: {not_requeued}")
+
+    # Summary for the logs only, the trigger doesn't act on it
+    return {"processed": len(messages), "requeued": requeued, "given_up": given_up}
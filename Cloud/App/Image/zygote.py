@@ -0,0 +1,194 @@
+import time
+
+start_time = time.perf_counter()
+
+import builtins
+import io
+import json
+import os
+import resource
+import select
+import signal
+import socket
+import sys
+import traceback
+import types
+
+# Fork server for Python solutions, started by `get_zygote` in app.py.
+# Interpreter and common modules are loaded once here, each test then runs in
+# a fresh forked child. The child's own setup (fds, limits, compilation of
+# the solution) is measured by the child itself and taken out of its rusage,
+# it's reported apart as `startup_time`.
+
+# Preloaded for solutions
+import bisect
+import collections
+import functools
+import heapq
+import itertools
+import math
+
+warmup_time = time.perf_counter() - start_time
+
+
+def run_child(request, fds, setup_fd):
+    os.setsid()
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    # Same sandbox as `RUSAGE_TRAMPOLINE` in app.py. Its failures are the
+    # judge's, not the solution's: reported through the setup pipe
+    solution_path = request["path"]
+    try:
+        sandbox = request["sandbox"]
+        for name, limit in sandbox["rlimits"].items():
+            resource.setrlimit(getattr(resource, name), tuple(limit))
+        if sandbox["uid"] is not None:
+            os.setgroups([])
+            os.setgid(sandbox["uid"])
+            os.setuid(sandbox["uid"])
+        with io.open_code(solution_path) as f:
+            source = f.read()
+    except BaseException:
+        traceback.print_exc()
+        os.write(setup_fd, json.dumps({"sandbox_error": True}).encode())
+        os._exit(127)
+
+    sys.argv = [solution_path]
+    sys.path[0] = os.path.dirname(solution_path)
+    sys.stdin = io.TextIOWrapper(io.FileIO(0, "r", closefd=False))
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False))
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, "w", closefd=False))
+
+    code = 0
+    try:
+        # As `python3 solution.py` does: a fresh `__main__` module
+        solution = compile(source, solution_path, "exec")
+        main_module = types.ModuleType("__main__")
+        main_module.__file__ = solution_path
+        main_module.__builtins__ = builtins
+        sys.modules["__main__"] = main_module
+
+        # Everything up to here is setup: the parent subtracts it
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        setup = {
+            "time": time.perf_counter(),
+            "user_time": usage.ru_utime,
+            "system_time": usage.ru_stime,
+        }
+        os.write(setup_fd, json.dumps(setup).encode())
+        os.close(setup_fd)
+
+        exec(solution, main_module.__dict__)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+        except Exception:
+            code = code or 1
+        sys.stderr.flush()
+    os._exit(code)
+
+
+def main(sock):
+    # Child exits wake `select` up through the signal wakeup fd
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+
+    children = {}
+    sock.send(json.dumps({"ready": True, "warmup_time": warmup_time}).encode())
+    while True:
+        deadlines = [child["deadline"] for child in children.values()]
+        timeout = None
+        if deadlines:
+            timeout = max(min(deadlines) - time.perf_counter(), 0)
+        ready, _, _ = select.select([sock, wakeup_read], [], [], timeout)
+
+        if wakeup_read in ready:
+            os.read(wakeup_read, 4096)
+
+        if sock in ready:
+            message, fds, _, _ = socket.recv_fds(sock, 65536, 3)
+            if not message:
+                # Judge has gone away
+                break
+            request = json.loads(message)
+            # Child writes its setup cost here (less than PIPE_BUF, never blocks)
+            setup_read, setup_write = os.pipe()
+            fork_start = time.perf_counter()
+            pid = os.fork()
+            if pid == 0:
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                sock.close()
+                os.close(wakeup_read)
+                os.close(wakeup_write)
+                os.close(setup_read)
+                # Nor the setup pipes of other solutions
+                for other in children.values():
+                    os.close(other["setup_fd"])
+                run_child(request, fds, setup_write)
+            os.close(setup_write)
+            for fd in fds:
+                os.close(fd)
+            children[pid] = {
+                "id": request["id"],
+                "start": fork_start,
+                "setup_fd": setup_read,
+                "deadline": fork_start + request["wall_limit"],
+                "killed": False,
+            }
+
+        now = time.perf_counter()
+        for pid, child in children.items():
+            if not child["killed"] and now >= child["deadline"]:
+                child["killed"] = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    # Not a group leader yet or already gone
+                    os.kill(pid, signal.SIGKILL)
+
+        while children:
+            pid, status, usage = os.wait4(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            child = children.pop(pid)
+            # Leftovers of a solution (e.g. forked children) go with the group
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            # Nothing written: the child died in setup, all of it is counted
+            setup = {"time": child["start"], "user_time": 0.0, "system_time": 0.0}
+            with os.fdopen(child["setup_fd"], "rb") as f:
+                written = f.read()
+            if written:
+                setup.update(json.loads(written))
+            report = {
+                "id": child["id"],
+                "status": status,
+                "user_time": max(usage.ru_utime - setup["user_time"], 0.0),
+                "system_time": max(usage.ru_stime - setup["system_time"], 0.0),
+                "max_rss": usage.ru_maxrss,
+                "wall_time": time.perf_counter() - setup["time"],
+                "startup_time": setup["time"] - child["start"],
+                "killed": child["killed"],
+                "sandbox_error": setup.get("sandbox_error", False),
+            }
+            sock.send(json.dumps(report).encode())
+
+
+if __name__ == "__main__":
+    main(socket.socket(fileno=int(sys.argv[1])))
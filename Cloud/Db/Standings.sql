@@ -0,0 +1,18 @@
+CREATE TABLE Standings
+(
+    contest Utf8 NOT NULL,
+    `user` Utf8 NOT NULL,
+    solved Int32,
+    penalty Int64,
+    rank_key Int64,
+    tasks Utf8,
+    INDEX standings_rank GLOBAL ON (contest, rank_key),
+    PRIMARY KEY (contest, `user`)
+)
+WITH (
+    AUTO_PARTITIONING_BY_SIZE = ENABLED,
+    AUTO_PARTITIONING_BY_LOAD = DISABLED,
+    AUTO_PARTITIONING_PARTITION_SIZE_MB = 2048,
+    AUTO_PARTITIONING_MIN_PARTITIONS_COUNT = 1,
+    KEY_BLOOM_FILTER = DISABLED
+);
@@ -0,0 +1,17 @@
+CREATE TABLE TaskStats
+(
+    contest Utf8 NOT NULL,
+    task_n Int32 NOT NULL,
+    total Int64,
+    version Int64,
+    time_sketch Utf8,
+    memory_sketch Utf8,
+    PRIMARY KEY (contest, task_n)
+)
+WITH (
+    AUTO_PARTITIONING_BY_SIZE = ENABLED,
+    AUTO_PARTITIONING_BY_LOAD = DISABLED,
+    AUTO_PARTITIONING_PARTITION_SIZE_MB = 2048,
+    AUTO_PARTITIONING_MIN_PARTITIONS_COUNT = 1,
+    KEY_BLOOM_FILTER = DISABLED
+);
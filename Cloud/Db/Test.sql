@@ -13,6 +13,7 @@ CREATE TABLE Results
     avg_memory_usage Double,
     min_memory_usage Double,
     max_memory_usage Double,
+    test_metrics String,
     INDEX contest_full GLOBAL ON (contest, task_n),
     PRIMARY KEY (task_id)
 )
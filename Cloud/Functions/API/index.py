@@ -1,22 +1,69 @@
+import base64
+import collections
+import hashlib
 import json
+import math
 import os
-import subprocess
+import threading
+import time
 import uuid
-from urllib.parse import urlencode
-import setuptools
 
-import boto3
-import requests
-import yandexcloud
-
-from yandex.cloud.lockbox.v1.payload_service_pb2 import GetPayloadRequest
-from yandex.cloud.lockbox.v1.payload_service_pb2_grpc import PayloadServiceStub
+# NOTE: boto3, yandexcloud and ydb are imported by the getters below, on the
+# first route that needs them: a cold start of /info (or of a request that
+# fails validation) doesn't load the cloud SDKs at all
 
 boto_session = None
+credentials = None
+credentials_expiry = 0
+credentials_lock = threading.Lock()
 storage_client = None
+docapi_resource = None
 docapi_table = None
 ymq_queue = None
 ymq_client = None
+driver = None
+ydb_session = None
+
+# Lockbox keys are cached by a warm instance for CREDENTIALS_TTL seconds
+# and fetched anew in the background during the last CREDENTIALS_REFRESH_MARGIN
+# of it, so requests wait for Lockbox only on a cold start (or after expiry)
+CREDENTIALS_TTL = float(os.getenv("CREDENTIALS_TTL", "3600"))
+CREDENTIALS_REFRESH_MARGIN = float(os.getenv("CREDENTIALS_REFRESH_MARGIN", "300"))
+
+# Submissions per /check_batch request
+CHECK_BATCH_MAX_SIZE = 100
+# YMQ limit of `send_messages`
+YMQ_BATCH_SIZE = 10
+YMQ_BATCH_RETRIES = 3
+
+# Long-poll of /status: the task is re-read with backoff until it changes
+# or the wait budget is spent. The budget is capped by LONG_POLL_MAX_WAIT and
+# by the time left of the invocation, less LONG_POLL_RESPONSE_MARGIN to answer
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "20"))
+LONG_POLL_RESPONSE_MARGIN = 1.0
+LONG_POLL_FIRST_DELAY = 0.25
+LONG_POLL_MAX_DELAY = 2.0
+TERMINAL_STATUSES = ["DONE", "ERROR"]
+
+# Task items in memory of a warm instance, LRU of STATUS_CACHE_SIZE: terminal
+# ones never change and are kept until evicted, others for PENDING_STATUS_TTL.
+# Responses tell the gateway / browsers the same with Cache-Control
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "4096"))
+PENDING_STATUS_TTL = float(os.getenv("PENDING_STATUS_TTL", "1"))
+# Not longer: percentile ranks of DONE responses move with other solutions
+TERMINAL_STATUS_MAX_AGE = 300
+
+status_cache = collections.OrderedDict()
+status_cache_lock = threading.Lock()
+
+# Task_ids per /status_batch request, BatchGetItem reads up to 100 keys
+STATUS_BATCH_MAX_SIZE = 1000
+DOCAPI_BATCH_GET_SIZE = 100
+DOCAPI_BATCH_RETRIES = 5
+
+# Page size of /standings
+STANDINGS_PAGE_SIZE = 50
+STANDINGS_MAX_PAGE_SIZE = 200
 
 
 def generate_error_mp(action, src_url, course, contest, language, task_n):
@@ -31,11 +78,10 @@ def generate_error_mp(action, src_url, course, contest, language, task_n):
     }
 
 
-def get_boto_session():
-    print("DEBUG | Boto-Session-1")
-    global boto_session
-    if boto_session is not None:
-        return boto_session
+def fetch_credentials():
+    import yandexcloud
+    from yandex.cloud.lockbox.v1.payload_service_pb2 import GetPayloadRequest
+    from yandex.cloud.lockbox.v1.payload_service_pb2_grpc import PayloadServiceStub
 
     # initialize Lockbox and read secret value
     yc_sdk = yandexcloud.SDK()
@@ -43,7 +89,6 @@ def get_boto_session():
     lockbox = PayloadServiceStub(channel)
     response = lockbox.Get(GetPayloadRequest(secret_id=os.environ["SECRET_ID"]))
 
-    print("DEBUG | Boto-Session-2")
     # extract values from secret
     access_key = None
     secret_key = None
@@ -57,12 +102,46 @@ def get_boto_session():
         raise Exception("Secrets required")
 
     print("Key id: " + access_key)
-    print("DEBUG | Boto-Session-3")
+    return access_key, secret_key
 
-    # initialize boto session
-    boto_session = boto3.session.Session(
-        aws_access_key_id=access_key, aws_secret_access_key=secret_key
-    )
+
+def set_credentials(keys):
+    global boto_session, credentials, credentials_expiry
+    global docapi_resource, docapi_table, ymq_queue, ymq_client, storage_client
+    if keys != credentials:
+        import boto3
+
+        # Rotated keys: clients are built anew on the next use, requests in
+        # flight finish with the old ones
+        boto_session = boto3.session.Session(
+            aws_access_key_id=keys[0], aws_secret_access_key=keys[1]
+        )
+        docapi_resource = docapi_table = None
+        ymq_queue = ymq_client = storage_client = None
+        credentials = keys
+    credentials_expiry = time.time() + CREDENTIALS_TTL
+
+
+def refresh_credentials():
+    try:
+        set_credentials(fetch_credentials())
+    except Exception as e:
+        # Cached keys are still valid, next request tries again
+        print(f"DEBUG | Unable to refresh credentials: {str(e)}")
+    finally:
+        credentials_lock.release()
+
+
+def get_boto_session():
+    print("DEBUG | Boto-Session-1")
+    remaining = credentials_expiry - time.time()
+    if boto_session is None or remaining <= 0:
+        with credentials_lock:
+            if boto_session is None or credentials_expiry <= time.time():
+                set_credentials(fetch_credentials())
+    elif remaining < CREDENTIALS_REFRESH_MARGIN and credentials_lock.acquire(False):
+        # Released by the refresh thread
+        threading.Thread(target=refresh_credentials, daemon=True).start()
 
     return boto_session
 
@@ -89,20 +168,26 @@ def get_ymq_queue():
     return ymq_queue
 
 
+def get_docapi_resource():
+    global docapi_resource
+    if docapi_resource is not None:
+        return docapi_resource
+
+    docapi_resource = get_boto_session().resource(
+        "dynamodb",
+        endpoint_url=os.environ["DOCAPI_ENDPOINT"],
+        region_name="ru-central1",
+    )
+
+    return docapi_resource
+
+
 def get_docapi_table():
     global docapi_table
     if docapi_table is not None:
         return docapi_table
 
-    docapi_table = (
-        get_boto_session()
-        .resource(
-            "dynamodb",
-            endpoint_url=os.environ["DOCAPI_ENDPOINT"],
-            region_name="ru-central1",
-        )
-        .Table("tasks")
-    )
+    docapi_table = get_docapi_resource().Table("tasks")
 
     return docapi_table
 
@@ -121,6 +206,25 @@ def get_storage_client():
     return storage_client
 
 
+def get_ydb_session():
+    global driver
+    global ydb_session
+    if driver is not None and ydb_session is not None:
+        return ydb_session
+    import ydb
+    import ydb.iam
+
+    driver = ydb.Driver(
+        endpoint=os.getenv("YDB_ENDPOINT"),
+        database=os.getenv("YDB_DATABASE"),
+        credentials=ydb.iam.MetadataUrlCredentials(),
+    )
+
+    driver.wait(fail_fast=True, timeout=5)
+    ydb_session = ydb.SessionPool(driver)
+    return ydb_session
+
+
 # TODO -- change name (not a client)
 def get_ymq_client():
     global ymq_client
@@ -142,10 +246,35 @@ def get_ymq_client():
 # -------
 
 
-def create_task(src_url, course, contest, language, task_n):
+def new_task_item(task_id, contest, task_n, user=None):
+    # `contest` / `task_n` locate the task aggregate for percentile ranks
+    item = {"task_id": task_id, "status": "NEW", "contest": contest, "task_n": task_n}
+    if user:
+        item["user"] = user
+    return item
+
+
+def new_task_message(task_id, src_url, course, contest, language, task_n, user=None):
+    return json.dumps(
+        {
+            "task_id": task_id,
+            "action": "check_disk",
+            "type": "standart",
+            "src_url": src_url,
+            "course": course,
+            "contest": contest,
+            "language": language,
+            "task_n": task_n,
+            # Standings are kept only for submissions with a user
+            "user": user,
+        }
+    )
+
+
+def create_task(src_url, course, contest, language, task_n, user=None):
     print("DEBUG | Create task")
     task_id = str(uuid.uuid4())
-    get_docapi_table().put_item(Item={"task_id": task_id, "status": "NEW"})
+    get_docapi_table().put_item(Item=new_task_item(task_id, contest, task_n, user))
     print(src_url)
     print(course)
     print(contest)
@@ -153,17 +282,8 @@ def create_task(src_url, course, contest, language, task_n):
     print(task_n)
 
     response = get_ymq_queue().send_message(
-        MessageBody=json.dumps(
-            {
-                "task_id": task_id,
-                "action": "check_disk",
-                "type": "standart",
-                "src_url": src_url,
-                "course": course,
-                "contest": contest,
-                "language": language,
-                "task_n": task_n,
-            }
+        MessageBody=new_task_message(
+            task_id, src_url, course, contest, language, task_n, user
         )
     )
 
@@ -178,6 +298,85 @@ def create_task(src_url, course, contest, language, task_n):
     }
 
 
+def send_task_messages(messages):
+    # `messages` maps task_id -> message body. One `send_messages` call per
+    # YMQ_BATCH_SIZE messages; entries YMQ failed to send are resent with
+    # backoff. Returns task_ids that are still not enqueued
+    pending = dict(messages)
+    failed = []
+    for attempt in range(YMQ_BATCH_RETRIES):
+        if attempt > 0:
+            time.sleep(0.1 * 2**attempt)
+        task_ids = list(pending)
+        for start in range(0, len(task_ids), YMQ_BATCH_SIZE):
+            chunk = task_ids[start : start + YMQ_BATCH_SIZE]
+            try:
+                response = get_ymq_queue().send_messages(
+                    Entries=[
+                        {"Id": str(i), "MessageBody": pending[task_id]}
+                        for i, task_id in enumerate(chunk)
+                    ]
+                )
+            except Exception as e:
+                # Some of the chunk may have been sent: not resent (that could
+                # judge a task twice), the whole chunk is reported as failed
+                print(f"DEBUG | Unable to send {len(chunk)} messages: {str(e)}")
+                for task_id in chunk:
+                    pending.pop(task_id)
+                failed += chunk
+                continue
+            for entry in response.get("Successful", []):
+                pending.pop(chunk[int(entry["Id"])])
+        if not pending:
+            break
+    return failed + list(pending)
+
+
+def create_tasks(submissions):
+    # Whole batch in a few requests: task items through a batch writer
+    # (BatchWriteItem of up to 25 items), messages by YMQ_BATCH_SIZE
+    print(f"DEBUG | Create {len(submissions)} tasks")
+    task_ids = [str(uuid.uuid4()) for _ in submissions]
+    with get_docapi_table().batch_writer() as batch:
+        for task_id, submission in zip(task_ids, submissions):
+            batch.put_item(
+                Item=new_task_item(
+                    task_id,
+                    submission["contest"],
+                    submission["task_n"],
+                    submission.get("user"),
+                )
+            )
+
+    failed = send_task_messages(
+        {
+            task_id: new_task_message(
+                task_id,
+                submission["src_url"],
+                submission["course"],
+                submission["contest"],
+                submission["language"],
+                submission["task_n"],
+                submission.get("user"),
+            )
+            for task_id, submission in zip(task_ids, submissions)
+        }
+    )
+    if failed:
+        # Otherwise they would stay NEW forever
+        with get_docapi_table().batch_writer() as batch:
+            for task_id in failed:
+                batch.put_item(Item={"task_id": task_id, "status": "ERROR"})
+
+    # Same order as submissions, null for the ones to resubmit
+    data = {"task_ids": [None if t in failed else t for t in task_ids]}
+    return {
+        "statusCode": 200,
+        "headers": {"content-type": "application/json"},
+        "body": json.dumps(data),
+    }
+
+
 def create_task_alternative(course, contest, language, task_n):
     task_id = str(uuid.uuid4())
 
@@ -233,18 +432,295 @@ def generate_presigned_upload(task_id, course, contest, language, task_n):
     return presigned_post
 
 
-def get_task_status(task_id):
+def sketch_rank(sketch, value):
+    # Share of values below `value` (ties count half), error is bounded by
+    # the relative width of a sketch bucket. Parameters come with the sketch
+    counts = [sketch["zero"]] + list(sketch["buckets"].values())
+    total = sum(counts)
+    if total == 0:
+        return None
+
+    below = 0
+    same = 0
+    if value <= sketch["min_value"]:
+        same = sketch["zero"]
+    else:
+        below = sketch["zero"]
+        value_key = math.ceil(math.log(value, sketch["gamma"]))
+        for key, count in sketch["buckets"].items():
+            if int(key) < value_key:
+                below += count
+            elif int(key) == value_key:
+                same += count
+    return (below + same / 2) / total
+
+
+def get_percentile_ranks(contest, task_n, avg_time_usage, avg_memory_usage):
+    import ydb
+
+    # One point read of the task aggregate, whatever the number of submissions
+    def run(session):
+        query = """
+        DECLARE $contest AS Utf8;
+        DECLARE $task_n AS Int32;
+
+        SELECT time_sketch, memory_sketch FROM TaskStats
+        WHERE contest = $contest AND task_n = $task_n;
+        """
+        prepared_query = session.prepare(query)
+        # Single-row read, no locks / commit needed
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, {"$contest": contest, "$task_n": task_n}, commit_tx=True
+        )
+        if result[0].rows:
+            return result[0].rows[0]
+        return None
+
+    stats = get_ydb_session().retry_operation_sync(run)
+    if stats is None:
+        return None
+
+    # Percentage of accepted solutions of the task that used more time / memory
+    ranks = {}
+    for kind, value, sketch in [
+        ("time", avg_time_usage, stats.time_sketch),
+        ("memory", avg_memory_usage, stats.memory_sketch),
+    ]:
+        rank = sketch_rank(json.loads(sketch), value)
+        if rank is not None:
+            ranks[kind] = round((1 - rank) * 100, 1)
+    return ranks
+
+
+def task_status_data(item):
+    if item["status"] == "DONE":
+        info = {
+            key: str(value)
+            for key, value in item.items()
+            if key not in ["task_id", "status"]
+        }
+        return {"status": "DONE", "info": info}
+    return {"status": item["status"]}
+
+
+def get_cached_item(task_id):
+    with status_cache_lock:
+        entry = status_cache.get(task_id)
+        if entry is None:
+            return None
+        expiry, item = entry
+        if expiry is not None and expiry < time.monotonic():
+            del status_cache[task_id]
+            return None
+        status_cache.move_to_end(task_id)
+        return item
+
+
+def cache_item(item):
+    expiry = None
+    if item["status"] not in TERMINAL_STATUSES:
+        expiry = time.monotonic() + PENDING_STATUS_TTL
+    with status_cache_lock:
+        status_cache[item["task_id"]] = (expiry, item)
+        status_cache.move_to_end(item["task_id"])
+        while len(status_cache) > STATUS_CACHE_SIZE:
+            status_cache.popitem(last=False)
+
+
+def read_task_status(task_id):
+    item = get_cached_item(task_id)
+    if item is None:
+        try:
+            item = get_docapi_table().get_item(Key={"task_id": task_id})["Item"]
+        except:
+            # Unknown task_id or a failed read, neither is cached
+            return {"status": "ERROR"}, None
+        cache_item(item)
+    return task_status_data(item), item
+
+
+def status_cache_control(item):
+    if item is None:
+        return "no-store"
+    if item["status"] in TERMINAL_STATUSES:
+        return f"public, max-age={TERMINAL_STATUS_MAX_AGE}"
+    return f"public, max-age={math.ceil(PENDING_STATUS_TTL)}"
+
+
+def status_etag(data):
+    # Version of the task item itself: percentile ranks aren't part of it,
+    # they move with other solutions of the task
+    digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:16]}"'
+
+
+def get_task_status(task_id, wait=0, etag=None, last_status=None):
+    # `etag` / `last_status` -- what the client has already seen. While the
+    # task matches it, it's re-read for up to `wait` seconds, and if it's
+    # still the same, the answer is an empty 304
     print("DEBUG | Get_task_status_1")
-    data = None
-    try:
-        task = get_docapi_table().get_item(Key={"task_id": task_id})
-        if task["Item"]["status"] == "DONE":
-            data = {"status": "DONE", "info": task["Item"]["info"]}
+
+    def unchanged(data):
+        if etag is not None:
+            return status_etag(data) == etag
+        return last_status is not None and data["status"] == last_status
+
+    deadline = time.monotonic() + min(wait, LONG_POLL_MAX_WAIT)
+    delay = LONG_POLL_FIRST_DELAY
+    data, item = read_task_status(task_id)
+    while unchanged(data) and data["status"] not in TERMINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, LONG_POLL_MAX_DELAY)
+        data, item = read_task_status(task_id)
+
+    headers = {
+        "content-type": "application/json",
+        "etag": status_etag(data),
+        "cache-control": status_cache_control(item),
+    }
+    if unchanged(data):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+
+    if data["status"] == "DONE" and data["info"].get("result") == "OK":
+        try:
+            ranks = get_percentile_ranks(
+                item["contest"],
+                int(item["task_n"]),
+                float(item["avg_time_limit"]),
+                float(item["avg_memory_limit"]),
+            )
+            if ranks is not None:
+                data["percentile_ranks"] = ranks
+        except Exception as e:
+            # Status itself is still valid without ranks
+            print(f"DEBUG | Unable to get percentile ranks: {str(e)}")
+
+    return {
+        "statusCode": 200,
+        "headers": headers,
+        "body": json.dumps(data),
+    }
+
+
+def get_task_statuses(task_ids):
+    # BatchGetItem by DOCAPI_BATCH_GET_SIZE keys; keys DocAPI leaves
+    # unprocessed (throttling, response size) are requested again with backoff.
+    # No percentile ranks here: they cost a YDB read per task, see /status
+    items = {}
+    for task_id in task_ids:
+        item = get_cached_item(task_id)
+        if item is not None:
+            items[task_id] = item
+    missing = [task_id for task_id in task_ids if task_id not in items]
+    for start in range(0, len(missing), DOCAPI_BATCH_GET_SIZE):
+        keys = [{"task_id": t} for t in missing[start : start + DOCAPI_BATCH_GET_SIZE]]
+        for attempt in range(DOCAPI_BATCH_RETRIES):
+            if attempt > 0:
+                time.sleep(0.05 * 2**attempt)
+            response = get_docapi_resource().batch_get_item(
+                RequestItems={"tasks": {"Keys": keys}}
+            )
+            for item in response["Responses"].get("tasks", []):
+                items[item["task_id"]] = item
+                cache_item(item)
+            keys = response.get("UnprocessedKeys", {}).get("tasks", {}).get("Keys")
+            if not keys:
+                break
         else:
-            data = {"status": task["Item"]["status"]}
-    except:
-        data = {"status": "ERROR"}
+            print(f"DEBUG | {len(keys)} task_ids left unprocessed")
+
+    # Same as /status: unknown (or unread) task_id is an ERROR
+    data = {
+        task_id: (
+            task_status_data(items[task_id])
+            if task_id in items
+            else {"status": "ERROR"}
+        )
+        for task_id in task_ids
+    }
+    return {
+        "statusCode": 200,
+        "headers": {"content-type": "application/json"},
+        "body": json.dumps(data),
+    }
+
+
+def encode_cursor(row, place):
+    cursor = {"rank_key": row.rank_key, "user": row.user, "place": place}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
 
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+def get_standings(contest, limit, cursor=None):
+    import ydb
+
+    # Keyset pagination over the `standings_rank` index: each page is a range
+    # read starting right after the last row of the previous one, so its cost
+    # doesn't depend on how deep the page is
+    def run(session):
+        if cursor is None:
+            query = """
+            DECLARE $contest AS Utf8;
+            DECLARE $limit AS Uint64;
+
+            SELECT `user`, solved, penalty, rank_key
+            FROM Standings VIEW standings_rank
+            WHERE contest = $contest
+            ORDER BY rank_key, `user`
+            LIMIT $limit;
+            """
+            params = {"$contest": contest, "$limit": limit}
+        else:
+            query = """
+            DECLARE $contest AS Utf8;
+            DECLARE $limit AS Uint64;
+            DECLARE $rank_key AS Int64;
+            DECLARE $user AS Utf8;
+
+            SELECT `user`, solved, penalty, rank_key
+            FROM Standings VIEW standings_rank
+            WHERE contest = $contest
+                AND (rank_key > $rank_key OR (rank_key = $rank_key AND `user` > $user))
+            ORDER BY rank_key, `user`
+            LIMIT $limit;
+            """
+            params = {
+                "$contest": contest,
+                "$limit": limit,
+                "$rank_key": cursor["rank_key"],
+                "$user": cursor["user"],
+            }
+        prepared_query = session.prepare(query)
+        # Standings may lag behind by a verdict, no locks / commit needed
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
+            prepared_query, params, commit_tx=True
+        )
+        return result[0].rows
+
+    rows = get_ydb_session().retry_operation_sync(run)
+    place = cursor["place"] if cursor is not None else 0
+    standings = []
+    for row in rows:
+        place += 1
+        standings.append(
+            {
+                "place": place,
+                "user": row.user,
+                "solved": row.solved,
+                "penalty": row.penalty,
+            }
+        )
+
+    data = {"contest": contest, "standings": standings}
+    # Full page -- there may be more rows after it
+    if len(rows) == limit:
+        data["next_cursor"] = encode_cursor(rows[-1], place)
     return {
         "statusCode": 200,
         "headers": {"content-type": "application/json"},
@@ -263,6 +739,45 @@ def get_task_status(task_id):
 # 4) contest -- номер контеста
 # 5) language -- язык для тестирования
 # 6) task_n -- номер задачи
+# 7) user -- участник (необязательный, для таблицы результатов)
+
+# check_batch -- пачка проверок с Яндекс.Диска: тело запроса -- JSON-список
+# объектов с параметрами 1), 3)-7)
+
+
+def read_body(event):
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode()
+    return json.loads(body)
+
+
+def normalize_submission(submission):
+    # Parameters as /check_disk gets them from the query string: non-empty
+    # strings, `contest` / `task_n` may also be integers (task 0 included).
+    # None if invalid: floats and the like would fail put_item midway a batch
+    if not isinstance(submission, dict):
+        return None
+    normalized = dict(submission)
+    for key in ["contest", "task_n"]:
+        value = submission.get(key)
+        if isinstance(value, int) and not isinstance(value, bool):
+            normalized[key] = str(value)
+    for key in ["src_url", "course", "contest", "language", "task_n"]:
+        if not isinstance(normalized.get(key), str) or not normalized[key]:
+            return None
+    if normalized.get("user") is not None and not isinstance(normalized["user"], str):
+        return None
+    return normalized
+
+
+def get_remaining_time(context):
+    # Seconds the invocation may still run before it's killed
+    try:
+        remaining = context.get_remaining_time_in_millis() / 1000
+    except Exception:
+        return LONG_POLL_MAX_WAIT
+    return remaining - LONG_POLL_RESPONSE_MARGIN
 
 
 def handle_api(event, context):
@@ -276,13 +791,14 @@ def handle_api(event, context):
         contest = event.get("params", event).get("contest", None)
         language = event.get("params", event).get("language", None)
         task_n = event.get("params", event).get("task_n", None)
+        user = event.get("params", event).get("user", None)
         print("SRC_URL: ", src_url)
         print("course: ", course)
         print("contest: ", contest)
         print("language: ", language)
         print("task_n: ", task_n)
         if src_url and course and contest and language and task_n:
-            return create_task(src_url, course, contest, language, task_n)
+            return create_task(src_url, course, contest, language, task_n, user)
         else:
             data = generate_error_mp(
                 path[1:], src_url, course, contest, language, task_n
@@ -292,14 +808,78 @@ def handle_api(event, context):
                 "headers": {"content-type": "application/json"},
                 "body": json.dumps(data),
             }
+    elif path == "/check_batch":
+        try:
+            submissions = read_body(event)
+        except Exception:
+            submissions = None
+        if not isinstance(submissions, list) or not submissions:
+            data = {"error": "Request body must be a non-empty JSON list!"}
+        elif len(submissions) > CHECK_BATCH_MAX_SIZE:
+            data = {"error": f"At most {CHECK_BATCH_MAX_SIZE} submissions per batch!"}
+        else:
+            submissions = [normalize_submission(s) for s in submissions]
+            invalid = [i for i, s in enumerate(submissions) if s is None]
+            if not invalid:
+                return create_tasks(submissions)
+            data = {
+                "error": "Missing or invalid parameters! Details:",
+                "invalid": invalid,
+            }
+        return {
+            "statusCode": 504,
+            "headers": {"content-type": "application/json"},
+            "body": json.dumps(data),
+        }
     elif path == "/status":
         print("DEBUG | ACTION == status")
         task_id = event.get("params", event).get("task_id", None)
+        # Long-poll: `wait` seconds for a change since `etag` (or the
+        # If-None-Match header) / `last_status`
+        headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+        etag = event.get("params", event).get("etag", headers.get("if-none-match"))
+        last_status = event.get("params", event).get("last_status", None)
+        try:
+            wait = float(event.get("params", event).get("wait", 0))
+        except ValueError:
+            wait = math.nan
+        if not math.isfinite(wait):
+            return {"error": "Invalid wait in params"}
+        wait = max(0.0, min(wait, get_remaining_time(context)))
         if task_id:
             print("DEBUG | GET_T_S, task_id=" + task_id)
-            return get_task_status(task_id)
+            return get_task_status(task_id, wait, etag, last_status)
         else:
             return {"error": "Missing task_id in params"}
+    elif path == "/status_batch":
+        # Comma-separated `task_ids` param or, for long lists, a JSON list body
+        task_ids = event.get("params", event).get("task_ids", None)
+        try:
+            task_ids = task_ids.split(",") if task_ids else read_body(event)
+        except Exception:
+            task_ids = None
+        if not isinstance(task_ids, list):
+            return {"error": "Missing task_ids in params"}
+        # Duplicates would fail the whole BatchGetItem
+        task_ids = [str(task_id).strip() for task_id in task_ids]
+        task_ids = list(dict.fromkeys(task_id for task_id in task_ids if task_id))
+        if not task_ids:
+            return {"error": "Missing task_ids in params"}
+        if len(task_ids) > STATUS_BATCH_MAX_SIZE:
+            return {"error": f"At most {STATUS_BATCH_MAX_SIZE} task_ids per request"}
+        return get_task_statuses(task_ids)
+    elif path == "/standings":
+        contest = event.get("params", event).get("contest", None)
+        if not contest:
+            return {"error": "Missing contest in params"}
+        try:
+            limit = int(event.get("params", event).get("limit", STANDINGS_PAGE_SIZE))
+            limit = max(1, min(limit, STANDINGS_MAX_PAGE_SIZE))
+            cursor = event.get("params", event).get("cursor", None)
+            cursor = decode_cursor(cursor) if cursor else None
+        except Exception:
+            return {"error": "Invalid limit or cursor in params"}
+        return get_standings(contest, limit, cursor)
     elif path == "/check_post":
         course = event.get("params", event).get("course", None)
         contest = event.get("params", event).get("contest", None)
@@ -318,10 +898,32 @@ def handle_api(event, context):
                 "check_disk": {
                     "description": "Проверка с загрузкой файла с Яндекс.Диска."
                 },
-                "get_task_status": {"description": "Узнать текущий статус задачи."},
+                "status_batch": {
+                    "description": "Статусы многих задач за один запрос: `task_ids` "
+                    "через запятую (или JSON-список в теле POST). Ответ -- словарь "
+                    "task_id -> статус, как у get_task_status, без percentile_ranks."
+                },
+                "check_batch": {
+                    "description": "Пачка проверок с Яндекс.Диска (POST, JSON-список "
+                    "параметров check_disk). Возвращает `task_ids` в том же порядке, "
+                    "null -- не поставлено в очередь, отправьте ещё раз."
+                },
+                "get_task_status": {
+                    "description": "Узнать текущий статус задачи. Для принятых решений -- "
+                    "`percentile_ranks`: процент решений задачи, которые медленнее / "
+                    "используют больше памяти. Long-poll: с `etag` (из заголовка "
+                    "ETag прошлого ответа) или `last_status` и `wait` (секунды) ответ "
+                    "приходит при изменении статуса, иначе -- пустой 304 по истечении "
+                    "`wait`."
+                },
                 "check_disk": {
                     "description": "Проверка с загрузкой файла с Яндекс.Диска."
                 },
+                "standings": {
+                    "description": "Таблица результатов контеста: больше решённых задач, "
+                    "затем меньше неудачных попыток. Постранично: `limit` строк, "
+                    "следующая страница -- по `cursor` из `next_cursor`."
+                },
                 "info": {"description": "Получить список всех доступных комманд."},
             },
             "parameters": {
@@ -333,6 +935,12 @@ def handle_api(event, context):
                 "contest": {"description": "Номер контеста."},
                 "language": {"description": "Язык, на котором написано решение."},
                 "task_n": {"description": "Номер задачи."},
+                "user": {
+                    "description": "Участник (необязательный). Только решения с ним "
+                    "попадают в таблицу результатов."
+                },
+                "limit": {"description": "Размер страницы таблицы результатов."},
+                "cursor": {"description": "Позиция следующей страницы результатов."},
             },
         }
         return {
@@ -0,0 +1,126 @@
+import io
+import math
+import os
+import threading
+
+# Function's file system is read-only except /tmp (font cache of matplotlib)
+os.environ.setdefault("MPLCONFIGDIR", "/tmp/matplotlib")
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Distribution graphs of a task (runtime / memory of accepted solutions).
+# Figures are headless (Agg, no pyplot and its global figure registry) and
+# built once per kind: a render only moves the bars, the "your solution"
+# marker and the title, then prints PNG bytes into memory.
+# Bars come from the quantile sketch of the task: consecutive log-spaced
+# buckets merged into at most `BINS` bars, on a log axis.
+
+BINS = 20
+# Free space around the bars, relative (the axis is logarithmic)
+MARGIN = 1.25
+
+GRAPHS = {
+    "time": {
+        "xlabel": "Average runtime usage (in seconds)",
+        "title": "Runtime distribution for task {contest}#{task_n}.",
+    },
+    "memory": {
+        "xlabel": "Average memory usage (in MB)",
+        "title": "Memory usage distribution for task {contest}#{task_n}.",
+    },
+}
+
+templates = {}
+templates_lock = threading.Lock()
+
+
+def build_template(kind):
+    figure = Figure(figsize=(10, 5))
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.set_xscale("log")
+    bars = axes.bar(
+        np.arange(1, BINS + 1),
+        np.zeros(BINS),
+        width=1,
+        align="edge",
+        edgecolor="black",
+    )
+    marker = axes.scatter(
+        [1], [0], color="red", label="Your solution", zorder=5, clip_on=False
+    )
+    axes.set_xlabel(GRAPHS[kind]["xlabel"])
+    axes.set_ylabel("Percentage of solutions")
+    axes.legend()
+    return {
+        "figure": figure,
+        "canvas": canvas,
+        "axes": axes,
+        "bars": bars,
+        "marker": marker,
+        "title": axes.set_title(""),
+    }
+
+
+def get_template(kind):
+    template = templates.get(kind)
+    if template is None:
+        template = build_template(kind)
+        templates[kind] = template
+    return template
+
+
+def sketch_histogram(sketch):
+    # Bin edges and counts: bucket k is (gamma^(k-1), gamma^k], a bar covers a
+    # run of consecutive buckets. Values at zero are counted in the first bar
+    gamma = sketch["gamma"]
+    keys = sorted(int(key) for key in sketch["buckets"])
+    if not keys:
+        # Zeros only: a single bar at the lowest bucket
+        keys = [math.ceil(math.log(sketch["min_value"], gamma))]
+    counts = np.array([sketch["buckets"].get(str(key), 0) for key in keys], dtype=float)
+    keys = np.array(keys, dtype=np.int64)
+    low, high = keys[0] - 1, keys[-1]
+    bins = min(BINS, high - low)
+    edge_keys = low + np.ceil(np.arange(bins + 1) * (high - low) / bins)
+    index = np.searchsorted(edge_keys, keys, side="left") - 1
+    histogram = np.bincount(index, weights=counts, minlength=bins)
+    histogram[0] += sketch["zero"]
+    return gamma**edge_keys, histogram
+
+
+def render_distribution(kind, sketch, user_value, **labels):
+    edges, histogram = sketch_histogram(sketch)
+    percentage = histogram / max(histogram.sum(), 1) * 100
+    # Log axis: values at zero are shown at the lowest edge
+    user_value = max(user_value, edges[0])
+
+    with templates_lock:
+        template = get_template(kind)
+        try:
+            for i, bar in enumerate(template["bars"]):
+                visible = i < len(percentage)
+                bar.set_visible(visible)
+                if visible:
+                    bar.set_x(edges[i])
+                    bar.set_width(edges[i + 1] - edges[i])
+                    bar.set_height(percentage[i])
+            template["marker"].set_offsets([[user_value, 0]])
+            template["axes"].set_xlim(
+                min(edges[0], user_value) / MARGIN,
+                max(edges[-1], user_value) * MARGIN,
+            )
+            template["axes"].set_ylim(0, max(percentage.max(initial=0), 1) * 1.05)
+            template["title"].set_text(GRAPHS[kind]["title"].format(**labels))
+
+            image = io.BytesIO()
+            template["canvas"].print_png(image)
+        except Exception:
+            # Half-updated template is dropped and built anew next time
+            templates.pop(kind, None)
+            template["figure"].clear()
+            raise
+
+    return image.getvalue()
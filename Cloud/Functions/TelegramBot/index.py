@@ -17,6 +17,7 @@ YDB_ENDPOINT = os.getenv("YDB_ENDPOINT")
 YDB_DATABASE = os.getenv("YDB_DATABASE")
 
 storage_client = None
+tasks_table = None
 driver = None
 boto_session = None
 
@@ -59,7 +60,8 @@ def get_user_state(user_id):
         SELECT state FROM Status WHERE user_id = $user_id;
         """
         prepared_query = session.prepare(query)
-        result = session.transaction(ydb.SerializableReadWrite()).execute(
+        # Single-row read, no locks / commit needed
+        result = session.transaction(ydb.OnlineReadOnly()).execute(
             prepared_query, {"$user_id": user_id}, commit_tx=True
         )
         if result[0].rows:
@@ -135,6 +137,33 @@ def get_storage_client():
     return storage_client
 
 
+def get_tasks_table():
+    global tasks_table
+    if tasks_table is not None:
+        return tasks_table
+
+    tasks_table = (
+        get_boto_session()
+        .resource(
+            "dynamodb",
+            endpoint_url=os.environ["DOCAPI_ENDPOINT"],
+            region_name="ru-central1",
+        )
+        .Table("tasks")
+    )
+
+    return tasks_table
+
+
+def get_deduplicated_from(task_id):
+    # A copy of an earlier verdict of the same solution (see `copy_stored_verdict`
+    # of the judge) has no Results row of its own, only a pointer to the original
+    item = get_tasks_table().get_item(Key={"task_id": task_id}).get("Item")
+    if item is None:
+        return None
+    return item.get("deduplicated_from")
+
+
 def download_from_bucket(bucket, object_name, d_path):
     try:
         pathlib.Path(d_path).parent.mkdir(parents=True, exist_ok=True)
@@ -159,18 +188,68 @@ def send_message(chat_id, text, token=TELEGRAM_BOT_TOKEN, reply_markup=None):
     return response
 
 
-def send_image(chat_id, image_path, caption=None, token=TELEGRAM_BOT_TOKEN):
+def send_image(chat_id, image, caption=None, token=TELEGRAM_BOT_TOKEN):
+    # `image` is PNG content, sent straight from memory
     url = TELEGRAM_API_ENDPOINT % token + "/sendPhoto"
     data = {"chat_id": chat_id}
     if caption:
         data["caption"] = caption
-    with open(image_path, "rb") as image_file:
-        files = {"photo": image_file}
-        response = requests.post(url, data=data, files=files)
+    files = {"photo": ("graph.png", image, "image/png")}
+    response = requests.post(url, data=data, files=files)
     # print(response)
     return response
 
 
+def get_solution_stats(task_id):
+    # Accepted solution and aggregate of its task (see Cloud/Db/TaskStats.sql)
+    def run(session):
+        query = """
+        DECLARE $task_id AS Utf8;
+
+        SELECT r.contest AS contest, r.task_n AS task_n,
+            r.avg_time_usage AS avg_time_usage, r.avg_memory_usage AS avg_memory_usage,
+            s.total AS total, s.version AS version,
+            s.time_sketch AS time_sketch, s.memory_sketch AS memory_sketch
+        FROM Results AS r
+        JOIN TaskStats AS s ON r.contest = s.contest AND r.task_n = s.task_n
+        WHERE r.task_id = $task_id;
+        """
+        prepared_query = session.prepare(query)
+        # Both tables are read at one consistent snapshot
+        result = session.transaction(ydb.SnapshotReadOnly()).execute(
+            prepared_query, {"$task_id": task_id}, commit_tx=True
+        )
+        if result[0].rows:
+            return result[0].rows[0]
+        return None
+
+    return pool.retry_operation_sync(run)
+
+
+def get_graph(task_id, kind, solution):
+    # Rendered on request and cached per aggregate version: another accepted
+    # solution of the task bumps it, so a stale image is never served
+    image_key = f"graphs/{kind}_distribution/{task_id}/v{solution.version}.png"
+    client = get_storage_client()
+    try:
+        return client.get_object(Bucket="hw-6", Key=image_key)["Body"].read()
+    except client.exceptions.NoSuchKey:
+        print(f"DEBUG | Rendering {image_key}...")
+
+    # Only this flow needs matplotlib, other updates don't pay for its import
+    import graphs
+
+    image = graphs.render_distribution(
+        kind,
+        json.loads(solution[f"{kind}_sketch"]),
+        solution[f"avg_{kind}_usage"],
+        contest=solution.contest,
+        task_n=solution.task_n,
+    )
+    client.put_object(Bucket="hw-6", Key=image_key, Body=image, ContentType="image/png")
+    return image
+
+
 def handle_message(sender, text):
     user_state = None
     try:
@@ -183,16 +262,21 @@ def handle_message(sender, text):
         # delete_user_state(sender)
         print("DEBUG | Handling task_id started...")
         try:
-            time_image_key = f"graphs/time_distribution/{task_id}.png"
-            time_image_path = f"/tmp/{task_id}_time_distribution.png"
-            download_from_bucket("hw-6", time_image_key, time_image_path)
-            send_image(sender, time_image_path, caption="This is your runtime usage!")
+            solution = get_solution_stats(task_id)
+            if solution is None:
+                original_task_id = get_deduplicated_from(task_id)
+                if original_task_id is not None:
+                    task_id = original_task_id
+                    solution = get_solution_stats(task_id)
+            if solution is None:
+                raise Exception("no accepted solution with this `task_id`")
+
+            time_image = get_graph(task_id, "time", solution)
+            send_image(sender, time_image, caption="This is your runtime usage!")
             print("DEBUG | Successfully send image-1!")
 
-            memory_image_key = f"graphs/memory_distribution/{task_id}.png"
-            memory_image_path = f"/tmp/{task_id}_memory_distribution.png"
-            download_from_bucket("hw-6", memory_image_key, memory_image_path)
-            send_image(sender, memory_image_path, caption="This is your memory usage!")
+            memory_image = get_graph(task_id, "memory", solution)
+            send_image(sender, memory_image, caption="This is your memory usage!")
             print("DEBUG | Successfully send image-2!")
             delete_user_state(sender)
             # for debug
@@ -1,3 +1,4 @@
+import os
 import magic
 from urllib.parse import urlencode
 import yandexcloud
@@ -6,10 +7,17 @@ import pathlib
 import tempfile
 import resource
 import boto3
+import numpy as np
+import ydb
 
 from yandex.cloud.lockbox.v1.payload_service_pb2 import GetPayloadRequest
 from yandex.cloud.lockbox.v1.payload_service_pb2_grpc import PayloadServiceStub
 
+boto_session = None
+tests_table = None
+storage_client = None
+ydb_driver = None
+
 
 def get_boto_session():
     global boto_session
@@ -57,3 +65,99 @@ def get_tests_table():
     )
 
     return tests_table
+
+
+def get_storage_client():
+    global storage_client
+    if storage_client is not None:
+        return storage_client
+
+    storage_client = get_boto_session().client(
+        service_name="s3",
+        endpoint_url="https://storage.yandexcloud.net",
+        region_name="ru-central1",
+    )
+
+    return storage_client
+
+
+def get_ydb_driver():
+    global ydb_driver
+    if ydb_driver is not None:
+        return ydb_driver
+
+    # Credentials as for the `ydb` CLI, e.g. YDB_SERVICE_ACCOUNT_KEY_FILE_CREDENTIALS
+    ydb_driver = ydb.Driver(
+        endpoint=os.environ["YDB_ENDPOINT"],
+        database=os.environ["YDB_DATABASE"],
+        credentials=ydb.credentials_from_env_variables(),
+    )
+    ydb_driver.wait(fail_fast=True, timeout=5)
+
+    return ydb_driver
+
+
+def scan_columns(query, parameters, columns, expected=0):
+    # Scan query streams rows in chunks (a data query stops at its result row
+    # limit), each chunk goes straight into one array per column: `columns`
+    # maps a name to its dtype. `expected` rows are preallocated, the arrays
+    # grow by doubling past that
+    arrays = {
+        name: np.empty(max(expected, 1024), dtype) for name, dtype in columns.items()
+    }
+    size = 0
+    for response in get_ydb_driver().table_client.scan_query(query, parameters):
+        rows = response.result_set.rows
+        capacity = len(next(iter(arrays.values())))
+        if size + len(rows) > capacity:
+            capacity = max(2 * capacity, size + len(rows))
+            for name, values in arrays.items():
+                grown = np.empty(capacity, values.dtype)
+                grown[:size] = values[:size]
+                arrays[name] = grown
+        for name, values in arrays.items():
+            values[size : size + len(rows)] = [row[name] for row in rows]
+        size += len(rows)
+
+    return {name: values[:size] for name, values in arrays.items()}
+
+
+def build_sketch(values, like):
+    # Quantile sketch of the judge (`sketch_add` of app.py) over a whole array,
+    # with the parameters of `like`, a sketch the judge has stored
+    gamma, min_value = like["gamma"], like["min_value"]
+    positive = values[values > min_value]
+    keys = np.ceil(np.log(positive) / np.log(gamma)).astype(np.int64)
+    buckets, counts = np.unique(keys, return_counts=True)
+    return {
+        "gamma": gamma,
+        "min_value": min_value,
+        "zero": int(len(values) - len(positive)),
+        "buckets": {str(key): int(count) for key, count in zip(buckets, counts)},
+    }
+
+
+def unpack_test_metrics(data):
+    # Per-test metrics of a Results row (`pack_test_metrics` of the judge):
+    # read-only structured array, `metrics["cpu_time"][i - 1]` is test #i.
+    # The .npy header gives the dtype, the records are used in place
+    stream = io.BytesIO(data)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(stream)
+    return np.frombuffer(data, dtype=dtype, count=shape[0], offset=stream.tell())
+
+
+def stack_test_metrics(blobs):
+    # Solutions x tests matrix of several solutions (None without metrics),
+    # NaN-padded when they were judged on a different number of tests
+    unpacked = [unpack_test_metrics(data) for data in blobs if data]
+    if not unpacked:
+        return None
+    tests = max(len(metrics) for metrics in unpacked)
+    stacked = np.full((len(unpacked), tests), np.nan, dtype=unpacked[0].dtype)
+    for row, metrics in zip(stacked, unpacked):
+        row[: len(metrics)] = metrics
+    return stacked
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import ydb
+
+import base
+
+# Refreshes analytics of a whole contest in one pass, e.g. after it ends:
+#   1. one export of the contest's Results (scan query),
+#   2. per-task quantile sketches, percentiles and outlier flags, vectorized,
+#   3. distribution graphs of every accepted solution, rendered across a
+#      process pool and uploaded in parallel to the keys the bot reads
+#      (see `get_graph` of TelegramBot), so it doesn't render them one by one,
+#   4. a report, `analytics/{contest}.json` in the graphs bucket.
+# Usage: python contest-analytics.py <contest> [processes]
+
+# Renderer of the bot is reused as is
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "Cloud",
+        "Functions",
+        "TelegramBot",
+    ),
+)
+
+GRAPHS_BUCKET = "hw-6"
+PERCENTILES = [50, 90, 99]
+# Tukey's fences: above Q3 + 1.5 * IQR is an outlier
+OUTLIER_IQR_FACTOR = 1.5
+SLOWEST_TESTS = 3
+UPLOAD_THREADS = 16
+
+EXPORT_YQL = """
+DECLARE $contest AS Utf8;
+
+SELECT task_id, task_n, avg_time_usage, avg_memory_usage, test_metrics
+FROM `Results`
+WHERE contest = $contest;
+"""
+
+EXPORT_COLUMNS = {
+    "task_id": object,
+    "task_n": np.int32,
+    "avg_time_usage": float,
+    "avg_memory_usage": float,
+    "test_metrics": object,
+}
+
+TASK_STATS_YQL = """
+DECLARE $contest AS Utf8;
+
+SELECT task_n, total, version, time_sketch, memory_sketch
+FROM `TaskStats`
+WHERE contest = $contest;
+"""
+
+
+def get_task_stats(contest):
+    # One row per task of the contest, small enough for a list
+    rows = []
+    for response in base.get_ydb_driver().table_client.scan_query(
+        ydb.ScanQuery(TASK_STATS_YQL, {"$contest": ydb.PrimitiveType.Utf8}),
+        {"$contest": contest},
+    ):
+        rows.extend(response.result_set.rows)
+    return {row.task_n: row for row in rows}
+
+
+def export_results(contest, expected=0):
+    # Filled as the scan streams, `expected` (total of the aggregates) rows
+    # are allocated upfront
+    results = base.scan_columns(
+        ydb.ScanQuery(EXPORT_YQL, {"$contest": ydb.PrimitiveType.Utf8}),
+        {"$contest": contest},
+        EXPORT_COLUMNS,
+        expected,
+    )
+    results["time"] = results.pop("avg_time_usage")
+    results["memory"] = results.pop("avg_memory_usage")
+    return results
+
+
+def outliers(values):
+    q1, q3 = np.percentile(values, [25, 75])
+    return values > q3 + OUTLIER_IQR_FACTOR * (q3 - q1)
+
+
+def slowest_tests(blobs):
+    # Tests with the highest mean CPU time over solutions (1-based numbers)
+    metrics = base.stack_test_metrics(blobs)
+    if metrics is None:
+        return []
+    mean = np.nanmean(metrics["cpu_time"], axis=0)
+    order = np.argsort(-mean)[:SLOWEST_TESTS]
+    return [
+        {"test": int(i) + 1, "mean_cpu_time": round(float(mean[i]), 6)} for i in order
+    ]
+
+
+def analyze_task(results, stats):
+    summary = {"total": len(results["task_id"]), "version": stats.version}
+    flagged = np.zeros(len(results["task_id"]), dtype=bool)
+    for kind in ["time", "memory"]:
+        values = results[kind]
+        is_outlier = outliers(values)
+        flagged |= is_outlier
+        summary[kind] = {
+            "sketch": base.build_sketch(values, json.loads(stats[f"{kind}_sketch"])),
+            "percentiles": dict(
+                zip(
+                    [f"p{p}" for p in PERCENTILES],
+                    np.percentile(values, PERCENTILES).round(6).tolist(),
+                )
+            ),
+            "outliers": results["task_id"][is_outlier].tolist(),
+        }
+    summary["slowest_tests"] = slowest_tests(results["test_metrics"])
+    return summary, flagged
+
+
+def render(job):
+    # Runs in pool processes: each keeps its own reusable figures
+    import graphs
+
+    key, kind, task_sketch, user_value, labels = job
+    return key, graphs.render_distribution(kind, task_sketch, user_value, **labels)
+
+
+def graph_jobs(contest, task_n, results, summary):
+    for i, task_id in enumerate(results["task_id"]):
+        for kind in ["time", "memory"]:
+            yield (
+                f"graphs/{kind}_distribution/{task_id}/v{summary['version']}.png",
+                kind,
+                summary[kind]["sketch"],
+                float(results[kind][i]),
+                {"contest": contest, "task_n": task_n},
+            )
+
+
+def upload(key, body, content_type):
+    base.get_storage_client().put_object(
+        Bucket=GRAPHS_BUCKET, Key=key, Body=body, ContentType=content_type
+    )
+
+
+def main(contest, processes=None):
+    task_stats = get_task_stats(contest)
+    results = export_results(
+        contest, sum(row.total or 0 for row in task_stats.values())
+    )
+    print(f"CFG | Exported {len(results['task_id'])} results of {contest}")
+
+    report = {"contest": contest, "tasks": {}}
+    jobs = []
+    task_ns, inverse = np.unique(results["task_n"], return_inverse=True)
+    for i, task_n in enumerate(task_ns.tolist()):
+        stats = task_stats.get(task_n)
+        if stats is None:
+            print(f"CFG | Task {contest}#{task_n} has no aggregate, skipped")
+            continue
+        rows = np.flatnonzero(inverse == i)
+        task_results = {name: values[rows] for name, values in results.items()}
+        summary, flagged = analyze_task(task_results, stats)
+        if summary["total"] != stats.total:
+            print(
+                f"CFG | Task {contest}#{task_n}: aggregate counts {stats.total} "
+                f"solutions, Results has {summary['total']}, rebuild it "
+                f"(tasks-rebuild.py {contest} {task_n})"
+            )
+        print(
+            f"CFG | Task {contest}#{task_n}: {summary['total']} solutions, "
+            f"{int(flagged.sum())} outliers"
+        )
+        report["tasks"][str(task_n)] = summary
+        jobs.extend(graph_jobs(contest, task_n, task_results, summary))
+
+    # Client is created before the upload threads share it
+    base.get_storage_client()
+    with ProcessPoolExecutor(processes) as renderers, ThreadPoolExecutor(
+        UPLOAD_THREADS
+    ) as uploaders:
+        chunksize = max(1, len(jobs) // ((processes or os.cpu_count() or 1) * 4))
+        uploads = [
+            uploaders.submit(upload, key, image, "image/png")
+            for key, image in renderers.map(render, jobs, chunksize=chunksize)
+        ]
+        uploads.append(
+            uploaders.submit(
+                upload,
+                f"analytics/{contest}.json",
+                json.dumps(report).encode(),
+                "application/json",
+            )
+        )
+        # Re-raises the first failed upload
+        for future in uploads:
+            future.result()
+
+    print(f"CFG | Rendered and uploaded {len(jobs)} graphs --> OK!")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
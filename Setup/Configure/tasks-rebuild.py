@@ -0,0 +1,121 @@
+import json
+import sys
+
+import ydb
+
+import base
+
+# Rebuilds task aggregates (TaskStats) from the whole Results history, e.g.
+# to backfill a task judged before TaskStats existed or to repair one that
+# `contest-analytics.py` reports as out of sync. Results are streamed with a
+# scan query straight into arrays, sized upfront by the current `total`.
+# Sketches keep the parameters (`gamma`, `min_value`) of the existing ones.
+# NOTE: solutions judged during the scan may be lost, run it when idle
+# Usage: python tasks-rebuild.py <contest> [task_n ...] (all tasks of TaskStats
+# by default)
+
+TASK_STATS_YQL = """
+DECLARE $contest AS Utf8;
+
+SELECT task_n, total, time_sketch, memory_sketch
+FROM `TaskStats`
+WHERE contest = $contest;
+"""
+
+RESULTS_YQL = """
+DECLARE $contest AS Utf8;
+DECLARE $task_n AS Int32;
+
+SELECT avg_time_usage, avg_memory_usage
+FROM `Results`
+WHERE contest = $contest AND task_n = $task_n;
+"""
+
+RESULTS_COLUMNS = {"avg_time_usage": float, "avg_memory_usage": float}
+
+REBUILD_YQL = """
+DECLARE $contest AS Utf8;
+DECLARE $task_n AS Int32;
+DECLARE $total AS Int64;
+DECLARE $time_sketch AS Utf8;
+DECLARE $memory_sketch AS Utf8;
+
+$version = SELECT version FROM `TaskStats` WHERE contest = $contest AND task_n = $task_n;
+
+UPSERT INTO `TaskStats` (`contest`, `task_n`, `total`, `version`, `time_sketch`, `memory_sketch`)
+VALUES ($contest, $task_n, $total, COALESCE($version, 0) + 1, $time_sketch, $memory_sketch);
+"""
+
+
+def get_aggregates(contest):
+    aggregates = {}
+    for response in base.get_ydb_driver().table_client.scan_query(
+        ydb.ScanQuery(TASK_STATS_YQL, {"$contest": ydb.PrimitiveType.Utf8}),
+        {"$contest": contest},
+    ):
+        for row in response.result_set.rows:
+            aggregates[row.task_n] = {
+                "total": row.total or 0,
+                "time_sketch": json.loads(row.time_sketch),
+                "memory_sketch": json.loads(row.memory_sketch),
+            }
+    return aggregates
+
+
+def rebuild_task(pool, contest, task_n, expected, like):
+    # `like` is an aggregate the sketches take their parameters from
+    results = base.scan_columns(
+        ydb.ScanQuery(
+            RESULTS_YQL,
+            {"$contest": ydb.PrimitiveType.Utf8, "$task_n": ydb.PrimitiveType.Int32},
+        ),
+        {"$contest": contest, "$task_n": task_n},
+        RESULTS_COLUMNS,
+        expected,
+    )
+    total = len(results["avg_time_usage"])
+
+    def run(session):
+        session.transaction(ydb.SerializableReadWrite()).execute(
+            session.prepare(REBUILD_YQL),
+            {
+                "$contest": contest,
+                "$task_n": task_n,
+                "$total": total,
+                "$time_sketch": json.dumps(
+                    base.build_sketch(results["avg_time_usage"], like["time_sketch"])
+                ),
+                "$memory_sketch": json.dumps(
+                    base.build_sketch(
+                        results["avg_memory_usage"], like["memory_sketch"]
+                    )
+                ),
+            },
+            commit_tx=True,
+        )
+
+    pool.retry_operation_sync(run)
+    return total
+
+
+def main(contest, task_ns):
+    aggregates = get_aggregates(contest)
+    if not aggregates:
+        # Sketch parameters are only defined by the judge
+        print(f"CFG | {contest} has no aggregates yet, the judge creates them")
+        return
+
+    pool = ydb.SessionPool(base.get_ydb_driver())
+    for task_n in task_ns or sorted(aggregates):
+        # A task without an aggregate takes sketch parameters of another one
+        like = aggregates.get(task_n, next(iter(aggregates.values())))
+        expected = aggregates[task_n]["total"] if task_n in aggregates else 0
+        total = rebuild_task(pool, contest, task_n, expected, like)
+        print(
+            f"CFG | Task {contest}#{task_n}: {total} solutions "
+            f"(aggregate had {expected}) --> OK!"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], [int(task_n) for task_n in sys.argv[2:]])
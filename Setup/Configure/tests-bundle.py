@@ -0,0 +1,56 @@
+import os
+import struct
+import sys
+
+import base
+
+# Packs tests of a task into one object, `{test_id}.bundle`, for judges:
+#   header: b"CTB1", tests count (uint32)
+#   index:  (in_offset, in_length, out_offset, out_length) as uint64 per test
+#   data:   inputs and expected outputs, addressed by the index
+# Usage: python tests-bundle.py <test_id> <tests directory>
+# Directory has the same layout as the bucket: `{test_id}_{n}_in.txt` / `_out.txt`
+
+BUNDLE_MAGIC = b"CTB1"
+BUNDLE_HEADER = struct.Struct("<4sI")
+BUNDLE_ENTRY = struct.Struct("<QQQQ")
+
+
+def pack_bundle(pairs):
+    offset = BUNDLE_HEADER.size + len(pairs) * BUNDLE_ENTRY.size
+    index = []
+    for test_in, test_out in pairs:
+        index.append((offset, len(test_in), offset + len(test_in), len(test_out)))
+        offset += len(test_in) + len(test_out)
+
+    chunks = [BUNDLE_HEADER.pack(BUNDLE_MAGIC, len(pairs))]
+    chunks += [BUNDLE_ENTRY.pack(*entry) for entry in index]
+    for test_in, test_out in pairs:
+        chunks += [test_in, test_out]
+    return b"".join(chunks)
+
+
+def read_tests(test_id, directory):
+    pairs = []
+    n = 1
+    while os.path.exists(os.path.join(directory, f"{test_id}_{n}_in.txt")):
+        with open(os.path.join(directory, f"{test_id}_{n}_in.txt"), "rb") as f:
+            test_in = f.read()
+        with open(os.path.join(directory, f"{test_id}_{n}_out.txt"), "rb") as f:
+            test_out = f.read()
+        pairs.append((test_in, test_out))
+        n += 1
+    return pairs
+
+
+test_id = sys.argv[1]
+pairs = read_tests(test_id, sys.argv[2])
+
+try:
+    base.get_storage_client().put_object(
+        Bucket="hw6-for-upload", Key=f"{test_id}.bundle", Body=pack_bundle(pairs)
+    )
+    print(f"CFG | Bundle with {len(pairs)} tests --> OK!")
+    print("CFG | Don't forget to bump `version` with `tests-change.py`!")
+except Exception as e:
+    print(f"CFG | Bundle upload --> Error: {str(e)}")
@@ -11,6 +11,8 @@ try:
             "total": {"Value": 2, "Action": "PUT"},
             "tl": {"Value": 100, "Action": "PUT"},
             "ml": {"Value": 1000, "Action": "PUT"},
+            # Bump after re-uploading test files, judges cache them by version
+            "version": {"Value": 2, "Action": "PUT"},
         },
     )
     print("CFG | Update_item --> OK!")
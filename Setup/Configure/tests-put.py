@@ -7,6 +7,16 @@ try:
             "total": 2,
             "tl": 100,
             "ml": 1000,
+            # 1 -- run tests concurrently (see `PARALLEL_CONTESTS` for per-contest)
+            "parallel": 0,
+            # 1 -- run Python solutions in a pre-forked interpreter (`ZYGOTE_CONTESTS`)
+            "zygote": 0,
+            # 1 -- run most often failing tests first (`FAIL_FAST_CONTESTS`)
+            "fail_fast": 0,
+            # Stamp for cached test files in judge containers
+            "version": 1,
+            # tokens -- whitespace-insensitive (default), exact -- byte by byte
+            "checker": "tokens",
         }
     )
     print("CFG | Put_item --> OK!")
@@ -23,3 +23,13 @@ aws dynamodb create-table \
             }
         ]" \
     --endpoint ${DOCUMENT_API_ENDPOINT}
+
+# Verdicts of judged solutions by hash of source + task version (judge skips
+# identical resubmissions, see `DEDUP_VERDICTS` in Cloud/App/Image/app.py)
+aws dynamodb create-table \
+    --table-name verdicts \
+    --attribute-definitions \
+      AttributeName=source_hash,AttributeType=S \
+    --key-schema \
+      AttributeName=source_hash,KeyType=HASH \
+    --endpoint ${DOCUMENT_API_ENDPOINT}
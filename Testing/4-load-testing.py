@@ -52,6 +52,24 @@ class UnlimitedUser(HttpUser):
         self.user = HttpUser
 
 
+class LongPollUser(HttpUser):
+    # Same as UnlimitedUser, but each request waits for a change of the status
+    # instead of returning at once (compare the request counts)
+    # SETUP -- добавить ваш API Gateway id
+    host = "https://<YOUR APIGW ID>.apigw.yandexcloud.net"
+    wait_time = 0
+    etag = None
+
+    @task(1)
+    def check_status(self):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = self.client.get(url + "&wait=20", headers=headers)
+        self.etag = response.headers.get("ETag", self.etag)
+
+    def __init__(self, HttpUser):
+        self.user = HttpUser
+
+
 def run_load_testing(scenario_class, num_users, spawn_rate, run_time):
     scenario = scenario_class()
     scenario.environment = scenario.create_environment()
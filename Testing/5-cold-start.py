@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+# Cold start of the API function, per route: each run is a fresh interpreter,
+# as a new function instance is. Measures the import of index.py, the first
+# call (init of the clients it needs + the request itself) and a warm call,
+# and lists the cloud SDKs each route has loaded.
+# Routes that go to the cloud need the function's environment (SECRET_ID,
+# DOCAPI_ENDPOINT, YDB_ENDPOINT, ...), without it they show up as errors.
+
+API_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "Cloud", "Functions", "API"
+)
+RUNS = 5
+
+# SETUP -- добавить ваш task_id (для /status)
+TASK_ID = "<YOUR TASK_ID>"
+
+ROUTES = {
+    "/info": {"path": "/info"},
+    "/check_disk (invalid)": {"path": "/check_disk", "params": {}},
+    "/status": {"path": "/status", "params": {"task_id": TASK_ID}},
+    "/standings": {"path": "/standings", "params": {"contest": "basic"}},
+}
+
+CHILD = """
+import json, sys, time
+
+start = time.perf_counter()
+import index
+imported = time.perf_counter()
+
+event = json.loads(sys.argv[1])
+error = None
+try:
+    index.handle_api(dict(event), None)
+except Exception as e:
+    error = repr(e)
+first = time.perf_counter()
+try:
+    index.handle_api(dict(event), None)
+except Exception:
+    pass
+warm = time.perf_counter()
+
+print(json.dumps({
+    "import": imported - start,
+    "first": first - imported,
+    "warm": warm - first,
+    "error": error,
+    "sdk": [m for m in ["boto3", "yandexcloud", "ydb", "grpc"] if m in sys.modules],
+}))
+"""
+
+
+def measure(event):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(event)],
+        cwd=API_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # Last line, index.py prints its debug output as well
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+print(f"{'route':<24}{'import, ms':>12}{'first, ms':>12}{'warm, ms':>12}  sdk")
+for route, event in ROUTES.items():
+    runs = [measure(event) for _ in range(RUNS)]
+    print(
+        f"{route:<24}"
+        f"{median([r['import'] for r in runs]) * 1000:>12.1f}"
+        f"{median([r['first'] for r in runs]) * 1000:>12.1f}"
+        f"{median([r['warm'] for r in runs]) * 1000:>12.1f}"
+        f"  {', '.join(runs[0]['sdk']) or '-'}"
+        + (f"  (error: {runs[0]['error']})" if runs[0]["error"] else "")
+    )